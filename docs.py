@@ -563,8 +563,10 @@ def insert_answers_in_document_forced(doc, questions, answers, question_formats)
     return modified
 
 # Identify and extract all quiz questions from the document
-def extract_all_quiz_questions(doc):
-    full_text = extract_lab_manual_text(doc)
+def extract_all_quiz_questions(doc, full_text=None):
+    # Reuse the caller's extracted text instead of walking the document again
+    if full_text is None:
+        full_text = extract_lab_manual_text(doc)
     
     # Extract all quiz sections
     all_questions = []
@@ -605,7 +607,7 @@ async def main():
     full_text = extract_lab_manual_text(doc)
     
     # Extract all questions from the document
-    all_questions = extract_all_quiz_questions(doc)
+    all_questions = extract_all_quiz_questions(doc, full_text)
     
     if all_questions:
         print(f"Found a total of {len(all_questions)} questions")
@@ -0,0 +1,262 @@
+import os
+import time
+import json
+import random
+import asyncio
+import datetime
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from question_extractor import create_student_answer
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.0-flash'
+# How long a registered manual context stays cached by the provider
+CONTEXT_CACHE_TTL_SECONDS = 3600
+# Price of a cached context token relative to a regular input token (storage fees aside)
+CACHED_TOKEN_RATE = 0.25
+CONTEXT_HEADER = "Lab manual content:\n"
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
+@dataclass
+class BackendResponse:
+    """Text returned by a backend plus its token usage"""
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Input tokens served from a registered context instead of the prompt
+    cached_tokens: int = 0
+    # Seconds from sending the request to the first streamed chunk
+    ttfb: float = None
+
+    @property
+    def total_tokens(self):
+        return self.input_tokens + self.output_tokens
+
+class BackendError(Exception):
+    """Backend failure carrying an HTTP-style status code (429, 503, ...)"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class ContextSession:
+    """A manual context registered once with a backend.
+
+    While the session is open, prompts carry only the questions; the backend
+    supplies the registered context itself. `cached_tokens` counts the
+    context tokens served from the session, and `retrieval_tokens` the
+    retrieved context the same prompts would otherwise have carried.
+    """
+
+    def __init__(self, context, context_tokens, handle=None):
+        self.context = context
+        self.context_tokens = context_tokens
+        self.handle = handle
+        self.cached_tokens = 0
+        self.retrieval_tokens = 0
+
+    def tokens_saved(self):
+        """Input tokens saved over sending retrieved context, with cached tokens at CACHED_TOKEN_RATE.
+
+        Negative when the session cost more than retrieval would have.
+        """
+        return round(self.retrieval_tokens - self.cached_tokens * CACHED_TOKEN_RATE)
+
+class AnswerBackend:
+    """Base class for answer backends.
+
+    `generate` receives the full prompt plus the questions it asks, so
+    backends that don't call a model can still answer them. In JSON mode
+    the response must map question ids (q1, q2, ...) to answers. When a
+    context session is given, the prompt omits the context.
+    """
+
+    name = None
+    model_name = None
+
+    async def generate(self, prompt, questions, json_mode=False, session=None):
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Open connections before the first real request (no-op by default)"""
+
+    async def create_context_session(self, context):
+        """Register `context` once for later prompts; None if unsupported"""
+        return None
+
+    async def close_context_session(self, session):
+        """Release a context session (no-op by default)"""
+
+class GeminiBackend(AnswerBackend):
+    """Google Gemini backend.
+
+    One long-lived model object (plus a JSON-mode twin) is created per
+    backend and shared by every concurrent request, so all calls reuse the
+    SDK client and its pooled keep-alive gRPC channel instead of paying for
+    client setup per question.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, model_name=DEFAULT_GEMINI_MODEL, api_key=None, generation_config=None):
+        # Imported here so the offline backends work without the SDK configured
+        import google.generativeai as genai
+        self.genai = genai
+        self.model_name = model_name
+        self.generation_config = dict(generation_config or {})
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.model = genai.GenerativeModel(model_name, generation_config=self.generation_config or None)
+        self.json_model = genai.GenerativeModel(
+            model_name,
+            generation_config={**self.generation_config, "response_mime_type": "application/json"}
+        )
+        self.session_models = {}
+
+    async def warm_up(self):
+        """Establish the connection with a cheap token-count call"""
+        try:
+            await self.model.count_tokens_async("warm-up")
+        except Exception as err:
+            print(f"Gemini warm-up failed: {str(err)}")
+
+    async def create_context_session(self, context):
+        """Store the context with Gemini's cached-content API"""
+        from google.generativeai import caching
+        try:
+            cached = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=self.model_name,
+                display_name="lab-manual-context",
+                contents=[CONTEXT_HEADER + context],
+                ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+            )
+        except Exception as err:
+            # Contexts below the provider's minimum size, or models without caching, end up here
+            print(f"Gemini context caching unavailable: {str(err)}")
+            return None
+        
+        session = ContextSession(context, cached.usage_metadata.total_token_count, handle=cached)
+        self.session_models[id(session)] = (
+            self.genai.GenerativeModel.from_cached_content(cached, generation_config=self.generation_config or None),
+            self.genai.GenerativeModel.from_cached_content(
+                cached, generation_config={**self.generation_config, "response_mime_type": "application/json"}
+            )
+        )
+        return session
+
+    async def close_context_session(self, session):
+        self.session_models.pop(id(session), None)
+        try:
+            await asyncio.to_thread(session.handle.delete)
+        except Exception as err:
+            print(f"Failed to delete Gemini cached context: {str(err)}")
+
+    async def generate(self, prompt, questions, json_mode=False, session=None):
+        if session is not None:
+            model, json_model = self.session_models[id(session)]
+        else:
+            model, json_model = self.model, self.json_model
+        # Stream the response so the time to first byte can be measured
+        started = time.monotonic()
+        response = await (json_model if json_mode else model).generate_content_async(prompt, stream=True)
+        ttfb = None
+        async for _ in response:
+            if ttfb is None:
+                ttfb = time.monotonic() - started
+        text = response.text.strip() if response.text else ''
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'total_token_count', None):
+            return BackendResponse(
+                text,
+                usage.prompt_token_count or 0,
+                usage.candidates_token_count or 0,
+                getattr(usage, 'cached_content_token_count', 0) or 0,
+                ttfb
+            )
+        return BackendResponse(text, estimate_tokens(prompt), estimate_tokens(text), ttfb=ttfb)
+
+class LocalBackend(AnswerBackend):
+    """Deterministic offline backend built on create_student_answer.
+
+    Context sessions are emulated: the registered context is kept locally
+    and reported as cached input tokens on every call, the way a provider
+    prefix cache would serve it.
+    """
+
+    name = 'local'
+    model_name = 'local-student-answer'
+
+    def answer(self, question, prompt):
+        return create_student_answer(question, prompt)
+
+    async def create_context_session(self, context):
+        return ContextSession(context, estimate_tokens(CONTEXT_HEADER + context))
+
+    async def generate(self, prompt, questions, json_mode=False, session=None):
+        if json_mode:
+            text = json.dumps({f"q{n}": self.answer(q, prompt) for n, q in enumerate(questions, 1)})
+        else:
+            text = self.answer(questions[0], prompt)
+        if session is not None:
+            return BackendResponse(
+                text, estimate_tokens(prompt) + session.context_tokens, estimate_tokens(text), session.context_tokens
+            )
+        return BackendResponse(text, estimate_tokens(prompt), estimate_tokens(text))
+
+class SyntheticBackend(LocalBackend):
+    """Offline backend with simulated latency and errors, for load-testing the pipeline.
+
+    Latency is drawn from `latency` ('constant', 'uniform' or 'lognormal')
+    around `latency_mean` seconds; `error_rate` of calls fail with a 429 or
+    503 BackendError so retries and backoff can be exercised.
+    """
+
+    name = 'synthetic'
+    model_name = 'synthetic'
+
+    def __init__(self, latency='lognormal', latency_mean=1.0, latency_spread=0.5, error_rate=0.0, seed=None):
+        if latency not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def sample_latency(self):
+        if self.latency == 'constant':
+            return self.latency_mean
+        if self.latency == 'uniform':
+            spread = self.latency_mean * self.latency_spread
+            return max(0.0, self.random.uniform(self.latency_mean - spread, self.latency_mean + spread))
+        # Lognormal with the requested mean; spread is the sigma of the underlying normal
+        sigma = self.latency_spread
+        mu = -sigma * sigma / 2
+        return self.latency_mean * self.random.lognormvariate(mu, sigma)
+
+    async def generate(self, prompt, questions, json_mode=False, session=None):
+        latency = self.sample_latency()
+        await asyncio.sleep(latency)
+        if self.random.random() < self.error_rate:
+            code = self.random.choice((429, 503))
+            raise BackendError(f"Synthetic {code} error", code)
+        response = await super().generate(prompt, questions, json_mode, session)
+        response.ttfb = latency
+        return response
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'local': LocalBackend,
+    'synthetic': SyntheticBackend,
+}
+
+def create_backend(name, **options):
+    """Create an answer backend by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown answer backend: {name}")
+    return BACKENDS[name](**options)
@@ -0,0 +1,107 @@
+import time
+import sqlite3
+import asyncio
+import hashlib
+
+DEFAULT_CACHE_PATH = "answer_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+def make_cache_key(question, context, prompt_version, model_name):
+    """Content-addressed key for an answer: hash of everything that shapes the prompt"""
+    digest = hashlib.sha256()
+    for part in (question.strip(), context, prompt_version, model_name):
+        data = part.encode('utf-8')
+        # Length-prefix each part so different splits never collide
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+class AnswerCache:
+    """Persistent SQLite answer cache shared between runs.
+
+    The database runs in WAL mode so several pipeline processes can read and
+    write it at once. Entries are evicted least-recently-used first once the
+    cache exceeds `max_entries` or `max_bytes` of answer text. Identical
+    requests made concurrently within one process are coalesced into a single
+    generation call.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._in_flight = {}
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                model TEXT,
+                prompt_version TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+
+    def get(self, key):
+        """Return the cached answer for `key`, or None"""
+        row = self.conn.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, question, answer, model_name=None, prompt_version=None):
+        """Store an answer and evict old entries if the cache is over its limits"""
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO answers (key, question, answer, model, prompt_version, size, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, question, answer, model_name, prompt_version, len(answer.encode('utf-8')), now, now)
+        )
+        self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits its limits"""
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        rows = self.conn.execute("SELECT key, size FROM answers ORDER BY last_used ASC").fetchall()
+        self.conn.execute("BEGIN")
+        try:
+            for key, size in rows:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                count -= 1
+                total -= size
+                removed += 1
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    async def coalesce(self, key, generate):
+        """Run `generate()` once per key, sharing the result with concurrent callers"""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(generate())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def close(self):
+        self.conn.close()
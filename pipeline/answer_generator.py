@@ -1,24 +1,242 @@
 import os
+import time
+import random
 import asyncio
 import json
-from dotenv import load_dotenv
-import google.generativeai as genai
+import hashlib
+from collections import defaultdict, deque
+from answer_backends import GeminiBackend, estimate_tokens
+from answer_cache import make_cache_key
+from answer_ledger import AnswerLedger, CallRecord, ledger_path
+from context_index import ContextIndex
+from context_store import load_context, has_context, missing_context_message
+from answer_markup import answer_markup
+from question_similarity import group_near_duplicates
 
-# Load environment variables
-load_dotenv()
+# Maximum number of backend requests in flight at once
+DEFAULT_CONCURRENCY = 4
 
-# Initialize Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+# Bump whenever the prompt wording changes so cached answers are regenerated
+PROMPT_VERSION = '1'
+# Manual text sent with each question: its most relevant chunks within this budget
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_TOP_K = 8
+# Context budget for a batched request, shared by all of its questions
+BATCH_CONTEXT_TOKEN_BUDGET = 3000
 
-async def generate_detailed_answer(question, context):
-    """Process quiz questions using Gemini API with detailed answers"""
-    model = genai.GenerativeModel('gemini-2.0-flash')
+# Gemini quotas and retry policy (free tier limits for gemini-2.0-flash)
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1000000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_BUDGET = 30
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Per-request deadline; a request still running after this is cancelled and retried
+DEFAULT_REQUEST_TIMEOUT = 120.0
+# Hedging: once enough latencies are observed, a request slower than the
+# HEDGE_PERCENTILE latency gets a duplicate, capped at a fraction of requests sent
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 5
+HEDGE_MAX_FRACTION = 0.1
+LATENCY_WINDOW = 200
+
+# Quota (429) and transient server errors are worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+ERROR_ANSWER = 'Error generating answer.'
+
+def is_retryable_error(err):
+    """Check whether an API error is a quota or transient server error"""
+    if isinstance(err, asyncio.TimeoutError):
+        return True
+    code = getattr(err, 'code', None)
+    if callable(code):
+        # grpc errors expose code() as a method returning a StatusCode
+        code = None
+    try:
+        return int(code) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute"""
     
-    prompt = f"""You are a student writing answers for a lab manual.
-Please generate a clean, professional, educational answer to the following question, based on the lab manual content.
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        """Seconds until `amount` tokens are available (amount is capped at capacity)"""
+        self.refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+    
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+    
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
 
-Format your answer for direct insertion into a Microsoft Word document:
+class RequestScheduler:
+    """Shared request scheduler: RPM/TPM token buckets plus retries with backoff.
+    
+    Every request waits for both buckets before it is sent. Quota and 5xx
+    errors are retried with exponential backoff and jitter, and a quota error
+    pauses all callers so concurrent requests settle just under the limit.
+    Retries are drawn from a run-wide budget so a dead backend fails fast.
+    
+    Each send has a deadline (`request_timeout`) after which it is cancelled
+    and treated as a retryable error. With `hedge`, a send that outlives the
+    observed p90 latency gets a duplicate request; whichever returns first
+    wins and the other is cancelled.
+    """
+    
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_budget=DEFAULT_RETRY_BUDGET,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, hedge=False):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.retries_used = 0
+        self.paused_until = 0.0
+        self.request_timeout = request_timeout
+        self.hedge = hedge
+        self.requests_sent = 0
+        self.hedges_sent = 0
+        # Recent successful latencies, kept separately for single and batched calls
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, tokens):
+        """Wait until one request and `tokens` tokens fit under the quotas"""
+        async with self._lock:
+            while True:
+                wait = max(
+                    self.paused_until - time.monotonic(),
+                    self.request_bucket.wait_time(1),
+                    self.token_bucket.wait_time(tokens)
+                )
+                if wait <= 0:
+                    self.request_bucket.consume(1)
+                    self.token_bucket.consume(tokens)
+                    return
+                await asyncio.sleep(wait)
+    
+    def try_acquire(self, tokens):
+        """Take one request and `tokens` tokens only if they are available right now"""
+        if (self.paused_until > time.monotonic() or self.request_bucket.wait_time(1) > 0
+                or self.token_bucket.wait_time(tokens) > 0):
+            return False
+        self.request_bucket.consume(1)
+        self.token_bucket.consume(tokens)
+        return True
+    
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the real token count is known"""
+        if actual_tokens > estimated_tokens:
+            self.token_bucket.consume(actual_tokens - estimated_tokens)
+        else:
+            self.token_bucket.refund(estimated_tokens - actual_tokens)
+    
+    def backoff_delay(self, attempt):
+        """Exponential backoff with equal jitter"""
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def hedge_delay(self, kind):
+        """Seconds after which a send of this kind is hedged, or None"""
+        samples = self.latencies[kind]
+        if not self.hedge or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.hedges_sent >= max(1, HEDGE_MAX_FRACTION * self.requests_sent):
+            return None
+        ordered = sorted(samples)
+        return ordered[int(HEDGE_PERCENTILE * (len(ordered) - 1))]
+    
+    async def send(self, request, estimated_tokens, record=None):
+        """Send one attempt under the deadline, hedging it if it runs slow"""
+        kind = record.source if record is not None else 'api'
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.request_timeout if self.request_timeout else None
+        tasks = [asyncio.ensure_future(request())]
+        self.requests_sent += 1
+        try:
+            hedge_after = self.hedge_delay(kind)
+            if hedge_after is not None:
+                if deadline is not None:
+                    hedge_after = min(hedge_after, deadline - started)
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                # Only hedge when the quota has room; a hedge must never cause a 429
+                if not done and self.try_acquire(estimated_tokens):
+                    print(f"Hedging a request slower than {hedge_after:.1f}s")
+                    self.hedges_sent += 1
+                    self.requests_sent += 1
+                    if record is not None:
+                        record.hedged = True
+                    tasks.append(asyncio.ensure_future(request()))
+            
+            error = None
+            while tasks:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError(f"Request exceeded the {self.request_timeout:.0f}s deadline")
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        self.latencies[kind].append(loop.time() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the losing (or timed-out) requests
+            for task in tasks:
+                task.cancel()
+    
+    async def run(self, request, estimated_tokens, record=None):
+        """Run `request()` (a coroutine factory) under the quotas, retrying transient errors.
+        
+        Each send is noted on `record` (a CallRecord) for the ledger.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(estimated_tokens)
+            if record is not None:
+                record.attempt_started()
+            try:
+                return await self.send(request, estimated_tokens, record)
+            except Exception as err:
+                if (not is_retryable_error(err) or attempt >= self.max_retries
+                        or self.retries_used >= self.retry_budget):
+                    raise
+                self.retries_used += 1
+                delay = self.backoff_delay(attempt)
+                if getattr(err, 'code', None) == 429:
+                    # Hold back every caller, not just this one
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                print(f"Retrying after error ({err.__class__.__name__}) in {delay:.1f}s "
+                      f"[retry {self.retries_used}/{self.retry_budget}]")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+def answer_context(question, context, index=None):
+    """The manual text sent along with a question: its most relevant chunks"""
+    if index is None:
+        index = ContextIndex(context)
+    return index.select(question, CONTEXT_TOKEN_BUDGET, CONTEXT_TOP_K)
+
+ANSWER_FORMAT_INSTRUCTIONS = """Format your answer for direct insertion into a Microsoft Word document:
 - Start with a short introduction (2–3 lines).
 - After that, create detailed points (bullet points if applicable).
 - End with a short conclusion (optional).
@@ -30,23 +248,327 @@ Format your answer for direct insertion into a Microsoft Word document:
 - For tables, describe using: <table>row1col1|row1col2;row2col1|row2col2</table>
 - For diagrams, describe with: <diagram>description</diagram>
 
-Make sure the answer flows like a mini textbook explanation. Keep spacing and clarity.
+Make sure the answer flows like a mini textbook explanation. Keep spacing and clarity."""
+
+def build_prompt(question, context=None):
+    """Build the answer prompt for a question and its context slice.
+
+    With no context, the prompt relies on the backend's context session.
+    """
+    prompt = f"""You are a student writing answers for a lab manual.
+Please generate a clean, professional, educational answer to the following question, based on the lab manual content.
+
+{ANSWER_FORMAT_INSTRUCTIONS}
 
 Question: {question}
+"""
+    if context is not None:
+        prompt += f"""
+Context: {context}
+"""
+    return prompt
+
+def build_batch_prompt(questions, context=None):
+    """Build one prompt answering several questions that share a context"""
+    numbered = "\n".join(f"q{n}: {question}" for n, question in enumerate(questions, 1))
+    prompt = f"""You are a student writing answers for a lab manual.
+Please generate a clean, professional, educational answer to each of the following questions, based on the lab manual content.
+
+{ANSWER_FORMAT_INSTRUCTIONS}
 
-Context: {context[:10000]}
+Respond with a JSON object that maps each question id (q1, q2, ...) to its answer as a string.
+Use \\n inside the strings for line breaks.
+
+Questions:
+{numbered}
+"""
+    if context is not None:
+        prompt += f"""
+Context: {context}
 """
+    return prompt
+
+async def generate_detailed_answer(question, context, scheduler=None, index=None, backend=None, session=None, record=None):
+    """Process quiz questions using the answer backend with detailed answers"""
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    if backend is None:
+        backend = GeminiBackend()
+    if session is not None:
+        prompt = build_prompt(question)
+    else:
+        prompt = build_prompt(question, answer_context(question, context, index))
     
+    estimated_tokens = estimate_tokens(prompt)
     try:
-        response = model.generate_content(prompt)
+        response = await scheduler.run(
+            lambda: backend.generate(prompt, [question], session=session), estimated_tokens, record
+        )
+        scheduler.record_usage(estimated_tokens, response.total_tokens)
+        if record is not None:
+            record.finish(response)
+        if session is not None:
+            session.cached_tokens += response.cached_tokens
+            session.retrieval_tokens += estimate_tokens(answer_context(question, context, index))
         answer = response.text.strip() if response.text else 'No answer generated.'
         print(f"\nQ: {question}\nA: {answer[:100]}...\n")  # Preview first 100 chars
         return answer
     except Exception as err:
         print(f"Error generating answer for '{question}': {str(err)}")
-        return 'Error generating answer.'
+        if record is not None:
+            record.finish(status='error')
+        return ERROR_ANSWER
+
+def batch_context(questions, index):
+    """The manual text sent with a batch: the chunks most relevant to all its questions"""
+    return index.select(" ".join(questions), BATCH_CONTEXT_TOKEN_BUDGET, CONTEXT_TOP_K * 2)
+
+async def generate_batch_answers(questions, context, scheduler=None, index=None, backend=None, session=None, record=None):
+    """Answer several questions sharing a context with a single JSON-mode request.
+
+    Returns one answer per question, or None for questions the response
+    didn't answer so the caller can fall back to single requests.
+    """
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    if index is None:
+        index = ContextIndex(context)
+    if backend is None:
+        backend = GeminiBackend()
+    if session is not None:
+        prompt = build_batch_prompt(questions)
+    else:
+        prompt = build_batch_prompt(questions, batch_context(questions, index))
+    
+    estimated_tokens = estimate_tokens(prompt)
+    try:
+        response = await scheduler.run(
+            lambda: backend.generate(prompt, questions, json_mode=True, session=session), estimated_tokens, record
+        )
+        scheduler.record_usage(estimated_tokens, response.total_tokens)
+        if record is not None:
+            record.finish(response)
+        if session is not None:
+            session.cached_tokens += response.cached_tokens
+            session.retrieval_tokens += estimate_tokens(batch_context(questions, index))
+        data = json.loads(response.text)
+    except Exception as err:
+        print(f"Error generating batch of {len(questions)} answers: {str(err)}")
+        if record is not None:
+            record.finish(status='error')
+        return [None] * len(questions)
+    
+    if not isinstance(data, dict):
+        print(f"Batch response was not a JSON object; answering {len(questions)} questions singly")
+        return [None] * len(questions)
+    
+    answers = []
+    for n, question in enumerate(questions, 1):
+        answer = data.get(f"q{n}")
+        if isinstance(answer, str) and answer.strip():
+            answer = answer.strip()
+            print(f"\nQ: {question}\nA: {answer[:100]}...\n")  # Preview first 100 chars
+            answers.append(answer)
+        else:
+            answers.append(None)
+    return answers
+
+def prompt_key(question, context, index, model_name, context_session=False):
+    """Cache key of the prompt `question` is answered with"""
+    prompt_context = context if context_session else answer_context(question, context, index)
+    return make_cache_key(question, prompt_context, PROMPT_VERSION, model_name)
 
-async def generate_and_save_answers(questions_json, answers_json):
+def batch_keys(questions, context, index, model_name, context_session=False):
+    """Cache keys of the answers to one batch prompt: the whole prompt plus each answer's position in it"""
+    prompt = build_batch_prompt(questions, context if context_session else batch_context(questions, index))
+    return [make_cache_key(f"q{n}", prompt, PROMPT_VERSION, model_name) for n in range(1, len(questions) + 1)]
+
+async def generate_answers(questions, context, concurrency=DEFAULT_CONCURRENCY, scheduler=None, cache=None, batch_size=1, backend=None, on_answer=None, context_session=False, question_index=None, ledger=None, index=None, origins=None):
+    """Generate answers concurrently with at most `concurrency` requests in flight.
+
+    Answers are returned in the same order as `questions`, so wall time is
+    bounded by the slowest question rather than the sum of all of them.
+    When a cache is given, cached answers are returned without an API call.
+    With `batch_size` above 1, uncached questions are packed into batched
+    requests; questions a batch response misses fall back to single calls.
+    Batch answers are cached under their batch prompt, not the question's
+    own prompt. `origins`, if given, is filled with one dict per question:
+    {"cache_key": key} for answers from a batch prompt, {"reused_from":
+    question} for near-duplicate reuse, {} otherwise.
+    `on_answer(question, answer, origin)` is called as soon as each new
+    answer arrives.
+    With `context_session`, the whole manual is registered with the backend
+    once and prompts carry only the questions. With a `question_index`,
+    near-duplicates of previously answered questions reuse the stored answer,
+    and near-duplicates within `questions` are generated once per group.
+    A reused answer is only a guess, so it is not cached, indexed or passed
+    to `on_answer`, and later runs look it up again.
+    Every answer, cached or generated, is recorded in `ledger` if given.
+    `index` is the manual's ContextIndex, built here if not given.
+    """
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    if backend is None:
+        backend = GeminiBackend()
+    if index is None:
+        # Index the manual once; each question then gets only its relevant chunks
+        index = ContextIndex(context)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total = len(questions)
+    answers = [None] * total
+    answer_origins = [{} for _ in range(total)]
+    session = None
+    
+    def log(record):
+        if ledger is not None:
+            ledger.record(record)
+    
+    def log_hit(question, source):
+        record = CallRecord([question], source)
+        record.finish()
+        log(record)
+    
+    def resolve(i, question, answer, origin=None):
+        answers[i] = answer
+        if answer == ERROR_ANSWER:
+            return
+        answer_origins[i] = origin or {}
+        if question_index is not None:
+            question_index.add(question, answer, backend.model_name, PROMPT_VERSION)
+        if on_answer is not None:
+            on_answer(question, answer, answer_origins[i])
+    
+    async def generate_one(i, question):
+        record = CallRecord([question], 'api')
+        async with semaphore:
+            print(f"Processing question {i+1}/{total}")
+            answer = await generate_detailed_answer(question, context, scheduler, index, backend, session, record)
+        log(record)
+        return answer
+    
+    async def answer_one(i, question, key):
+        if key is None:
+            resolve(i, question, await generate_one(i, question))
+            return
+        
+        async def generate_and_store():
+            answer = await generate_one(i, question)
+            if answer != ERROR_ANSWER:
+                cache.put(key, question, answer, backend.model_name, PROMPT_VERSION)
+            return answer
+        
+        resolve(i, question, await cache.coalesce(key, generate_and_store))
+    
+    async def answer_batch(batch):
+        if len(batch) == 1:
+            await answer_one(*batch[0])
+            return
+        
+        batch_questions = [q for _, q, _ in batch]
+        keys = batch_keys(batch_questions, context, index, backend.model_name, context_session)
+        if cache is not None:
+            uncached = []
+            for (i, question, key), batch_key in zip(batch, keys):
+                cached = cache.get(batch_key)
+                if cached is None:
+                    uncached.append((i, question, key))
+                    continue
+                print(f"Question {i+1}/{total} answered from cache.")
+                answers[i] = cached
+                answer_origins[i] = {"cache_key": batch_key}
+                log_hit(question, 'cache')
+            if len(uncached) < len(batch):
+                # The rest make a different batch prompt, with keys of its own
+                if uncached:
+                    await answer_batch(uncached)
+                return
+        
+        record = CallRecord(batch_questions, 'batch')
+        async with semaphore:
+            print(f"Processing questions {', '.join(str(i+1) for i, _, _ in batch)} of {total} in one request")
+            batch_answers = await generate_batch_answers(batch_questions, context, scheduler, index, backend, session, record)
+        log(record)
+        
+        missing = []
+        for (i, question, key), batch_key, answer in zip(batch, keys, batch_answers):
+            if answer is None:
+                missing.append((i, question, key))
+                continue
+            resolve(i, question, answer, {"cache_key": batch_key})
+            if cache is not None:
+                cache.put(batch_key, question, answer, backend.model_name, PROMPT_VERSION)
+        if missing:
+            print(f"Batch response missed {len(missing)} questions; answering them singly")
+            await asyncio.gather(*(answer_one(*item) for item in missing))
+    
+    pending = []
+    for i, question in enumerate(questions):
+        key = None
+        if cache is not None:
+            key = prompt_key(question, context, index, backend.model_name, context_session)
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Question {i+1}/{total} answered from cache.")
+                answers[i] = cached
+                log_hit(question, 'cache')
+                continue
+        if question_index is not None:
+            match = question_index.lookup(question, backend.model_name, PROMPT_VERSION)
+            if match is not None:
+                stored_question, answer, similarity = match
+                print(f"Question {i+1}/{total} reuses the answer to '{stored_question[:50]}' (similarity {similarity:.2f})")
+                answers[i] = answer
+                answer_origins[i] = {"reused_from": stored_question}
+                log_hit(question, 'near_duplicate')
+                continue
+        pending.append((i, question, key))
+    
+    # Near-duplicates within this run are generated once per group
+    followers = []
+    if question_index is not None and len(pending) > 1:
+        groups = group_near_duplicates([q for _, q, _ in pending], question_index.threshold)
+        followers = [(item, pending[leader]) for item, leader in zip(pending, groups) if pending[leader] is not item]
+        pending = [item for item, leader in zip(pending, groups) if pending[leader] is item]
+    
+    if pending:
+        await backend.warm_up()
+        if context_session:
+            session = await backend.create_context_session(context)
+            if session is None:
+                print("Context session unavailable; sending context with each prompt")
+            else:
+                print(f"Registered {session.context_tokens} context tokens for this run")
+    
+    try:
+        if batch_size > 1:
+            batches = [pending[j:j + batch_size] for j in range(0, len(pending), batch_size)]
+            await asyncio.gather(*(answer_batch(batch) for batch in batches))
+        else:
+            await asyncio.gather(*(answer_one(*item) for item in pending))
+    finally:
+        if session is not None:
+            await backend.close_context_session(session)
+            saved = session.tokens_saved()
+            print(f"Context session served {session.cached_tokens} cached context tokens in place of "
+                  f"{session.retrieval_tokens} tokens of retrieved context")
+            if saved >= 0:
+                print(f"Context session saved about {saved} input tokens")
+            else:
+                print(f"Context session cost about {-saved} input tokens more than sending retrieved context; "
+                      f"retrieval is cheaper for this manual")
+    
+    for (i, question, key), (leader, leader_question, _) in followers:
+        answers[i] = answers[leader]
+        if answers[i] != ERROR_ANSWER:
+            print(f"Question {i+1}/{total} reuses the answer to '{leader_question[:50]}' from this run")
+            question_index.hits += 1
+            answer_origins[i] = {"reused_from": leader_question}
+            log_hit(question, 'near_duplicate')
+    if origins is not None:
+        origins[:] = answer_origins
+    return answers
+
+async def generate_and_save_answers(questions_json, answers_json, concurrency=DEFAULT_CONCURRENCY, scheduler=None, cache=None, batch_size=1, backend=None, context_session=False, question_index=None):
     """Generate answers for questions and save to JSON file"""
     print(f"Loading questions from {questions_json}")
     
@@ -54,20 +576,36 @@ async def generate_and_save_answers(questions_json, answers_json):
         data = json.load(f)
     
     questions = data.get("questions", [])
-    context = data.get("context", "")
+    if not has_context(data, questions_json):
+        print(missing_context_message(questions_json))
+        return False
+    context = load_context(data, questions_json)
     
     if questions:
         print(f"Generating answers for {len(questions)} questions...")
+        if backend is None:
+            backend = GeminiBackend()
+        index = ContextIndex(context)
         
-        answers = []
-        for i, question in enumerate(questions):
-            print(f"Processing question {i+1}/{len(questions)}")
-            answer = await generate_detailed_answer(question, context)
-            answers.append(answer)
+        origins = []
+        answers = await generate_answers(questions, context, concurrency, scheduler, cache, batch_size, backend,
+                                         context_session=context_session, question_index=question_index, index=index,
+                                         origins=origins)
+        
+        qa_pairs = []
+        for question, answer, origin in zip(questions, answers, origins):
+            pair = {"question": question, "answer": answer}
+            if "reused_from" in origin:
+                pair["reused_from"] = origin["reused_from"]
+            else:
+                pair["cache_key"] = origin.get("cache_key") or prompt_key(question, context, index,
+                                                                          backend.model_name, context_session)
+            pair["markup"] = answer_markup(answer)
+            qa_pairs.append(pair)
         
         answers_data = {
-            "qa_pairs": [{"question": q, "answer": a} for q, a in zip(questions, answers)],
-            "question_indices": data.get("question_indices", []),
+            "qa_pairs": qa_pairs,
+            "question_anchors": data.get("question_anchors", []),
             "question_texts": data.get("question_texts", []),
             "question_formats": data.get("question_formats", [])
         }
@@ -81,15 +619,107 @@ async def generate_and_save_answers(questions_json, answers_json):
         print("No questions found.")
         return False
 
-async def update_answers(questions_json, answers_json):
-    """Update answers only for new questions"""
+def checkpoint_path(answers_json):
+    """Path of the checkpoint log kept next to the answers file"""
+    return answers_json + ".checkpoint.jsonl"
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it over `path`"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class AnswerCheckpoint:
+    """Append-only JSONL log of answers, persisted as each answer arrives.
+    
+    The first line records a run id (a hash of the questions and context) so
+    a checkpoint left by a different manual is ignored rather than resumed.
+    """
+    
+    def __init__(self, path, run_id):
+        self.path = path
+        self.run_id = run_id
+        self.file = None
+    
+    def load(self):
+        """Records (answer and origin) saved by an interrupted run of the same manual, by question"""
+        answers = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return answers
+        
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A kill mid-write can leave a truncated last line
+                continue
+        if not records or records[0].get("run_id") != self.run_id:
+            return answers
+        for record in records[1:]:
+            if "question" in record and "answer" in record:
+                answers[record["question"].strip()] = record
+        return answers
+    
+    def open(self, resume):
+        """Open the log for appending, starting a new one unless resuming"""
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self.write({"run_id": self.run_id})
+    
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def append(self, question, answer, origin=None):
+        self.write({"question": question, "answer": answer, **(origin or {})})
+    
+    def remove(self):
+        """Close and delete the log once the final answers file is written"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def update_answers(questions_json, answers_json, concurrency=DEFAULT_CONCURRENCY, scheduler=None, cache=None, batch_size=1, backend=None, context_session=False, question_index=None):
+    """Update answers for the questions of the current manual.
+
+    Each stored answer keeps the cache key of its prompt (question, context,
+    prompt version and model). With a cache, a stored answer is reused while
+    its key still matches, or if it was saved before keys were recorded, and
+    other questions are looked up in the cache, so only questions whose
+    prompt changed hit the API. Without one, stored answers are reused by
+    question text. Either way, answers edited by hand in `answers_json` are
+    kept. Answers reused from a near-duplicate question are recorded with
+    "reused_from" instead of a key and looked up again on the next run.
+    """
     print(f"Loading questions from {questions_json}")
     
     with open(questions_json, 'r', encoding='utf-8') as f:
         questions_data = json.load(f)
     
     questions = questions_data.get("questions", [])
-    context = questions_data.get("context", "")
+    if not has_context(questions_data, questions_json):
+        print(missing_context_message(questions_json))
+        return False
+    context = load_context(questions_data, questions_json)
+    if backend is None:
+        backend = GeminiBackend()
+    index = ContextIndex(context)
+    
+    run_id = hashlib.sha256(json.dumps([questions, context]).encode('utf-8')).hexdigest()
+    checkpoint = AnswerCheckpoint(checkpoint_path(answers_json), run_id)
+    resumed = checkpoint.load()
+    if resumed:
+        print(f"Resuming from checkpoint with {len(resumed)} answers")
     
     try:
         with open(answers_json, 'r', encoding='utf-8') as f:
@@ -98,33 +728,105 @@ async def update_answers(questions_json, answers_json):
     except (FileNotFoundError, json.JSONDecodeError):
         answers_data = {
             "qa_pairs": [],
-            "question_indices": questions_data.get("question_indices", []),
+            "question_anchors": questions_data.get("question_anchors", []),
             "question_texts": questions_data.get("question_texts", []),
             "question_formats": questions_data.get("question_formats", [])
         }
         qa_pairs = []
     
-    existing_qa = {pair["question"].strip(): pair["answer"] for pair in qa_pairs}
-    new_answers = 0
+    # Markup parsed when an answer was first saved is kept with it
+    stored_markup = {pair["answer"]: pair.get("markup") for pair in qa_pairs}
+    stored_pairs = {pair["question"].strip(): pair for pair in qa_pairs}
     
+    # Collect this manual's questions in document order, skipping repeats
+    unique_questions = []
+    pending = []
+    existing_qa = {}
+    cache_keys = {}
+    reused_from = {}
     for i, question in enumerate(questions):
-        if question.strip() not in existing_qa:
-            print(f"Processing new question {i+1}/{len(questions)}")
-            answer = await generate_detailed_answer(question, context)
-            qa_pairs.append({"question": question, "answer": answer})
-            new_answers += 1
-        else:
+        key = question.strip()
+        if key in cache_keys:
+            continue
+        cache_keys[key] = prompt_key(question, context, index, backend.model_name, context_session)
+        unique_questions.append(question)
+        stored = stored_pairs.get(key)
+        if key in resumed:
+            existing_qa[key] = resumed[key]["answer"]
+            cache_keys[key] = resumed[key].get("cache_key", cache_keys[key])
+        elif stored is not None and (cache is None or (
+                "reused_from" not in stored and stored.get("cache_key", cache_keys[key]) == cache_keys[key])):
+            # Pairs saved before keys were recorded have none; they are kept and stamped with the current key
+            existing_qa[key] = stored["answer"]
+            cache_keys[key] = stored.get("cache_key", cache_keys[key])
+            if "reused_from" in stored:
+                reused_from[key] = stored["reused_from"]
+        if key in existing_qa:
             print(f"Question {i+1} already answered.")
+        else:
+            pending.append(question)
+    
+    if pending:
+        print(f"Answering {len(pending)} questions (concurrency {concurrency})...")
+    checkpoint.open(resume=bool(resumed))
+    ledger = AnswerLedger(ledger_path(answers_json))
+    origins = []
+    try:
+        answers = await generate_answers(pending, context, concurrency, scheduler, cache, batch_size, backend,
+                                         on_answer=checkpoint.append, context_session=context_session,
+                                         question_index=question_index, ledger=ledger, index=index, origins=origins)
+    finally:
+        ledger.close()
+    generated = {}
+    for question, answer, origin in zip(pending, answers, origins):
+        key = question.strip()
+        generated[key] = answer
+        if "reused_from" in origin:
+            reused_from[key] = origin["reused_from"]
+        # Batch answers are recorded under their batch prompt's key
+        cache_keys[key] = origin.get("cache_key", cache_keys[key])
+    
+    # Keep only the current manual's answers so the list doesn't grow across manuals
+    qa_pairs = []
+    failed = 0
+    for question in unique_questions:
+        key = question.strip()
+        answer = existing_qa.get(key, generated.get(key))
+        if answer == ERROR_ANSWER:
+            # Don't store failures as answers, so the next run retries them
+            failed += 1
+            continue
+        pair = {"question": question, "answer": answer}
+        if key in reused_from:
+            # Reused answers carry no key, so a run with a cache looks them up again
+            pair["reused_from"] = reused_from[key]
+        else:
+            pair["cache_key"] = cache_keys[key]
+        pair["markup"] = answer_markup(answer, stored_markup.get(answer))
+        qa_pairs.append(pair)
     
     answers_data["qa_pairs"] = qa_pairs
-    answers_data["question_indices"] = questions_data.get("question_indices", [])
+    answers_data["question_anchors"] = questions_data.get("question_anchors", [])
+    # Positional indices from older extractions are superseded by the anchors
+    answers_data.pop("question_indices", None)
     answers_data["question_texts"] = questions_data.get("question_texts", [])
     answers_data["question_formats"] = questions_data.get("question_formats", [])
     
-    with open(answers_json, 'w', encoding='utf-8') as f:
-        json.dump(answers_data, f, ensure_ascii=False, indent=2)
+    write_json_atomic(answers_json, answers_data)
+    checkpoint.remove()
     
+    new_answers = len(pending) - failed
+    if cache is not None:
+        new_answers -= cache.hits
+        print(f"Answer cache: {cache.hits} hits, {cache.misses} misses")
+    if question_index is not None:
+        new_answers -= question_index.hits
+        print(f"Near-duplicate reuse: {question_index.hits}/{question_index.lookups} lookups "
+              f"({question_index.hit_rate():.0%} hit rate)")
     print(f"Generated {new_answers} new answers. Total: {len(qa_pairs)}")
+    if failed:
+        print(f"Failed to generate {failed} answers; re-run to retry them.")
+    ledger.print_summary()
     return True
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import numpy as np
+
+def ledger_path(answers_json):
+    """Path of the ledger kept next to the answers file"""
+    return os.path.splitext(answers_json)[0] + ".ledger.jsonl"
+
+class CallRecord:
+    """Timing, token and retry figures for one answer (or one batched call).
+
+    `source` is 'api', 'batch', 'cache' or 'near_duplicate'. Times are
+    measured with time.monotonic() and reported in seconds.
+    """
+
+    def __init__(self, questions, source='api'):
+        self.questions = list(questions)
+        self.source = source
+        self.enqueued = time.monotonic()
+        self.first_sent = None
+        self.attempt_sent = None
+        self.finished = None
+        self.attempts = 0
+        self.hedged = False
+        self.ttfb = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.status = 'ok'
+
+    def attempt_started(self):
+        """Called by the scheduler each time the request is actually sent"""
+        now = time.monotonic()
+        if self.first_sent is None:
+            self.first_sent = now
+        self.attempt_sent = now
+        self.attempts += 1
+
+    def finish(self, response=None, status='ok'):
+        self.finished = time.monotonic()
+        self.status = status
+        if response is not None:
+            self.input_tokens = response.input_tokens
+            self.output_tokens = response.output_tokens
+            self.cached_tokens = response.cached_tokens
+            if response.ttfb is not None:
+                self.ttfb = response.ttfb
+
+    @property
+    def queue_wait(self):
+        """Time spent waiting for a concurrency slot and the rate limiter"""
+        if self.first_sent is None:
+            return 0.0
+        return self.first_sent - self.enqueued
+
+    @property
+    def latency(self):
+        """Time from the first send until the answer arrived, including retries"""
+        if self.first_sent is None or self.finished is None:
+            return 0.0
+        return self.finished - self.first_sent
+
+    def to_dict(self):
+        return {
+            "questions": self.questions,
+            "source": self.source,
+            "cache": "hit" if self.source in ('cache', 'near_duplicate') else "miss",
+            "status": self.status,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "queue_wait": round(self.queue_wait, 4),
+            "ttfb": round(self.ttfb, 4) if self.ttfb is not None else None,
+            "latency": round(self.latency, 4),
+            "retries": max(0, self.attempts - 1),
+            "hedged": self.hedged
+        }
+
+class AnswerLedger:
+    """Per-call ledger of answer generation, written as JSONL as calls finish"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def record(self, record):
+        self.records.append(record)
+        self.file.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def summary(self):
+        """Latency percentiles over backend calls plus token and cache totals"""
+        calls = [r for r in self.records if r.source in ('api', 'batch')]
+        latencies = np.array([r.latency for r in calls]) if calls else np.zeros(1)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "calls": len(calls),
+            "errors": sum(1 for r in calls if r.status != 'ok'),
+            "cache_hits": sum(1 for r in self.records if r.source in ('cache', 'near_duplicate')),
+            "retries": sum(max(0, r.attempts - 1) for r in calls),
+            "hedged": sum(1 for r in calls if r.hedged),
+            "input_tokens": sum(r.input_tokens for r in calls),
+            "output_tokens": sum(r.output_tokens for r in calls),
+            "cached_tokens": sum(r.cached_tokens for r in calls),
+            "latency_p50": float(p50),
+            "latency_p95": float(p95),
+            "latency_p99": float(p99)
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"Ledger: {s['calls']} backend calls ({s['errors']} failed, {s['retries']} retries, "
+              f"{s['hedged']} hedged), {s['cache_hits']} cache hits")
+        print(f"Latency p50/p95/p99: {s['latency_p50']:.2f}s / {s['latency_p95']:.2f}s / {s['latency_p99']:.2f}s")
+        print(f"Tokens: {s['input_tokens']} input ({s['cached_tokens']} cached), {s['output_tokens']} output")
+        print(f"Ledger written to {self.path}")
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,109 @@
+import re
+import hashlib
+from functools import lru_cache
+
+# Bumped when the block layout changes, so markup stored with older answers is parsed again
+MARKUP_VERSION = 2
+
+BULLET = '•'
+# Tables and diagrams take up a whole answer line
+BLOCK_PATTERN = re.compile(r'<table>(.*?)</table>|<diagram>(.*?)</diagram>')
+INLINE_TAG_PATTERN = re.compile(r'<(/?)(bi|b|i)>')
+# Bold and italic switched on by each inline tag
+TAG_STYLES = {'b': (1, 0), 'i': (0, 1), 'bi': (1, 1)}
+
+def parse_runs(text, tags):
+    """Styled runs of one line of text as [text, style] pairs.
+
+    `tags` are the (start, end, closing, name) inline tags found in `text`.
+    A closing tag ends the most recent open tag of the same name, so nested
+    and overlapping tags both work. A tag that is never closed (or closes
+    nothing) is kept as literal text, and the rest of the line is still
+    parsed. `style` is '', 'b', 'i' or 'bi'.
+    """
+    # Pair up opening and closing tags first, so unmatched ones can stay literal
+    open_tags = {name: [] for name in TAG_STYLES}
+    matched = set()
+    for index, (_, _, closing, name) in enumerate(tags):
+        if not closing:
+            open_tags[name].append(index)
+        elif open_tags[name]:
+            matched.add(open_tags[name].pop())
+            matched.add(index)
+
+    runs = []
+    bold = italic = 0
+    position = 0
+
+    def add(segment):
+        if not segment:
+            return
+        style = ('b' if bold else '') + ('i' if italic else '')
+        if runs and runs[-1][1] == style:
+            runs[-1][0] += segment
+        else:
+            runs.append([segment, style])
+
+    for index, (start, end, closing, name) in enumerate(tags):
+        if index not in matched:
+            continue
+        add(text[position:start])
+        position = end
+        step = -1 if closing else 1
+        bold += TAG_STYLES[name][0] * step
+        italic += TAG_STYLES[name][1] * step
+    add(text[position:])
+    return runs
+
+def parse_paragraph(text):
+    """Paragraph block {bullet, runs} of a line or table cell"""
+    bullet = text.startswith(BULLET)
+    if bullet:
+        text = text[len(BULLET):].strip()
+    tags = [(m.start(), m.end(), bool(m.group(1)), m.group(2)) for m in INLINE_TAG_PATTERN.finditer(text)]
+    return {"bullet": bullet, "runs": parse_runs(text, tags)}
+
+def parse_table(table_desc):
+    """Rows of cell paragraph blocks from 'r1c1|r1c2;r2c1|r2c2'. Rows may differ in length."""
+    return [[parse_paragraph(cell.strip()) for cell in row.split('|')] for row in table_desc.split(';')]
+
+def parse_line(line):
+    """Block for one non-empty answer line"""
+    # A table or diagram anywhere in the line stands for the whole line; a table wins over a diagram
+    diagram = None
+    for match in BLOCK_PATTERN.finditer(line):
+        if match.group(1) is not None:
+            return {"type": "table", "rows": parse_table(match.group(1))}
+        if diagram is None:
+            diagram = match.group(2)
+    if diagram is not None:
+        return {"type": "diagram", "text": diagram}
+    return {"type": "paragraph", **parse_paragraph(line)}
+
+@lru_cache(maxsize=4096)
+def _parse_answer(answer):
+    return tuple(parse_line(line) for line in (raw.strip() for raw in answer.split('\n')) if line)
+
+def parse_answer(answer):
+    """Answer text as a list of blocks.
+
+    Each non-empty line becomes a table ({type, rows}), a diagram
+    ({type, text}) or a paragraph ({type, bullet, runs}). Blocks are plain
+    lists and dicts, so they can be stored in the answers JSON. Treat them
+    as read-only: parses are memoized per answer text.
+    """
+    return list(_parse_answer(answer))
+
+def answer_digest(answer):
+    return hashlib.sha256((answer or "").encode('utf-8')).hexdigest()[:16]
+
+def answer_markup(answer, stored=None):
+    """Versioned markup of an answer, reusing `stored` markup if it is current.
+
+    Markup records a digest of the answer it was parsed from, so an answer
+    edited by hand in the answers file is parsed again.
+    """
+    digest = answer_digest(answer)
+    if isinstance(stored, dict) and stored.get("version") == MARKUP_VERSION and stored.get("digest") == digest:
+        return stored
+    return {"version": MARKUP_VERSION, "digest": digest, "blocks": parse_answer(answer or "")}
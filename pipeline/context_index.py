@@ -0,0 +1,120 @@
+import re
+import numpy as np
+
+# Target size of each context chunk, in characters
+CHUNK_CHARS = 800
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r'\w+')
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how in is it its of on or that the
+their them there these this to was what when where which who why will with you your
+""".split())
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords or single characters"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS):
+    """Split manual text into chunks of roughly `chunk_chars`, breaking on line boundaries"""
+    chunks = []
+    current = []
+    size = 0
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if size and size + len(line) > chunk_chars:
+            chunks.append('\n'.join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+class ContextIndex:
+    """BM25 index over the chunks of one manual.
+
+    Built once per manual; `select` returns the chunks most relevant to a
+    question (in document order) that fit within a token budget. BM25
+    weights are stored as postings grouped by term (CSR style): the chunks
+    of term t are `chunk_ids[offsets[t]:offsets[t + 1]]`, with their
+    weights alongside, so memory grows with the text rather than with
+    chunks x vocabulary.
+    """
+
+    def __init__(self, text, chunk_chars=CHUNK_CHARS):
+        self.text = text
+        self.chunks = chunk_text(text, chunk_chars)
+        self.vocab = {}
+
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(self.chunks), dtype=np.float32)
+        for i, chunk in enumerate(self.chunks):
+            tokens = tokenize(chunk)
+            lengths[i] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                term_id = self.vocab.setdefault(token, len(self.vocab))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+            rows.extend([i] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+
+        # Group the (chunk, term, count) entries by term, chunks ascending within each term
+        order = np.argsort(np.array(cols, dtype=np.int64), kind='stable')
+        self.chunk_ids = np.array(rows, dtype=np.int32)[order]
+        term_ids = np.array(cols, dtype=np.int64)[order]
+        tf = np.array(counts, dtype=np.float32)[order]
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        self.offsets = np.concatenate(([0], np.cumsum(df)))
+
+        # Precompute the BM25 weight of every posting
+        n = max(len(self.chunks), 1)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        if avg_length <= 0:
+            avg_length = 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+        self.weights = (tf * (BM25_K1 + 1)) / (tf + norm[self.chunk_ids]) * idf[term_ids]
+
+    def scores(self, question):
+        """BM25 score of every chunk for a question"""
+        term_ids = [self.vocab[t] for t in set(tokenize(question)) if t in self.vocab]
+        if not term_ids:
+            return np.zeros(len(self.chunks), dtype=np.float32)
+        # Only the postings of the question's terms are touched, added term by term
+        scores = np.zeros(len(self.chunks), dtype=self.weights.dtype)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.chunk_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def select(self, question, token_budget, top_k=None):
+        """Most relevant chunks for `question` within roughly `token_budget` tokens"""
+        char_budget = token_budget * 4
+        scores = self.scores(question)
+        ranked = [i for i in np.argsort(-scores, kind='stable') if scores[i] > 0]
+        if top_k is not None:
+            ranked = ranked[:top_k]
+        if not ranked:
+            # Nothing in the manual matches; fall back to its opening text
+            return self.text[:char_budget]
+
+        chosen = []
+        used = 0
+        for i in ranked:
+            size = len(self.chunks[i]) + 1
+            if used + size > char_budget:
+                if chosen:
+                    continue
+                # Always send at least the best chunk, trimmed to the budget
+                chosen.append(i)
+                break
+            chosen.append(i)
+            used += size
+        return '\n'.join(self.chunks[i] for i in sorted(chosen))[:char_budget]
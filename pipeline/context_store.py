@@ -0,0 +1,57 @@
+import os
+import hashlib
+
+# Directory name, next to the questions JSON, holding the context sidecar files
+CONTEXT_STORE_DIR = "context_store"
+
+def context_store_dir(questions_json):
+    """Sidecar directory used for a questions JSON file"""
+    return os.path.join(os.path.dirname(os.path.abspath(questions_json)), CONTEXT_STORE_DIR)
+
+def context_path(digest, store_dir):
+    return os.path.join(store_dir, f"{digest}.txt")
+
+def store_context(text, store_dir):
+    """Write manual text to the store once and return its sha256.
+
+    Files are named by the hash of their content, so a manual extracted
+    again, or an identical copy of it, reuses the file already stored.
+    """
+    data = text.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    path = context_path(digest, store_dir)
+    if not os.path.exists(path):
+        os.makedirs(store_dir, exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+def read_context(digest, store_dir):
+    """Manual text stored under `digest`"""
+    with open(context_path(digest, store_dir), 'rb') as f:
+        return f.read().decode('utf-8')
+
+def has_context(questions_data, questions_json):
+    """Whether the context referenced by saved question data can be loaded"""
+    digest = questions_data.get("context_ref")
+    if digest is None:
+        return "context" in questions_data
+    return os.path.exists(context_path(digest, context_store_dir(questions_json)))
+
+def missing_context_message(questions_json):
+    return (f"Error: the manual text referenced by '{questions_json}' is missing from "
+            f"{context_store_dir(questions_json)}. Re-run extraction (--extract-only) to restore it.")
+
+def load_context(questions_data, questions_json):
+    """Manual text for saved question data.
+
+    Reads the sidecar referenced by "context_ref"; question files written
+    before the store existed carry the text inline as "context".
+    """
+    digest = questions_data.get("context_ref")
+    if digest is None:
+        return questions_data.get("context", "")
+    return read_context(digest, context_store_dir(questions_json))
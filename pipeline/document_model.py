@@ -0,0 +1,106 @@
+import os
+import hashlib
+from docx import Document
+from docx.document import Document as DocxDocument
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from style_resolver import StyleResolver
+
+# Body elements whose paragraphs get their own anchors: tables and content controls
+ANCHOR_CONTAINERS = frozenset(qn(tag) for tag in ('w:tbl', 'w:tr', 'w:tc', 'w:sdt', 'w:sdtContent'))
+
+def iter_body_paragraphs(parent, path=()):
+    """(path, w:p) for each paragraph below `parent` in document order.
+    
+    `path` is the element index at each level from the body down, so a
+    paragraph in a table cell gets e.g. (5, 1, 0, 0): table, row, cell,
+    paragraph. Paragraphs inside tables and content controls are included.
+    """
+    i = 0
+    for child in parent:
+        # Comments and processing instructions don't take an index
+        if not isinstance(child.tag, str):
+            continue
+        if child.tag == qn('w:p'):
+            yield path + (i,), child
+        elif child.tag in ANCHOR_CONTAINERS:
+            yield from iter_body_paragraphs(child, path + (i,))
+        i += 1
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+
+def make_anchor(path, text):
+    """Stable location of a paragraph: its element path plus a hash of its text"""
+    return f"{'/'.join(map(str, path))}:{text_hash(text)}"
+
+class ParsedDocument:
+    """A DOCX manual parsed once and shared by extraction and writing.
+
+    Holds the python-docx Document (and through it the lxml tree), an index
+    of its body paragraphs and table-cell paragraphs with their text, the
+    extracted full text and a StyleResolver for effective formatting.
+    `anchored_paragraphs` lists every paragraph of the body, table cells
+    included, with its anchor (see make_anchor) and text; `locate` maps an
+    anchor back to its w:p element. The writer edits `doc` in place, so
+    build the text-dependent parts (extraction) before writing answers.
+    """
+
+    def __init__(self, path, doc=None):
+        self.path = path
+        self.doc = doc if doc is not None else Document(path)
+        self.body = self.doc.element.body
+
+        # Paragraph and table proxies are built once here and reused
+        self.paragraphs = self.doc.paragraphs
+        self.paragraph_texts = [para.text for para in self.paragraphs]
+        self.tables = self.doc.tables
+        self.table_paragraphs = [
+            para
+            for table in self.tables
+            for row in table.rows
+            for cell in row.cells
+            for para in cell.paragraphs
+        ]
+        self.text = "\n".join(self.paragraph_texts + [para.text for para in self.table_paragraphs])
+        self.styles = StyleResolver.from_document(self.doc)
+        
+        # One walk of the body indexes every paragraph by anchor and by text hash
+        self.anchored_paragraphs = []
+        self.anchors = {}
+        self.text_hashes = {}
+        for path, p in iter_body_paragraphs(self.body):
+            para = Paragraph(p, self.doc._body)
+            text = para.text
+            anchor = make_anchor(path, text)
+            self.anchored_paragraphs.append((anchor, para, text))
+            self.anchors[anchor] = p
+            digest = text_hash(text)
+            # A text hash only identifies a paragraph if it is unique
+            self.text_hashes[digest] = None if digest in self.text_hashes else p
+    
+    def locate(self, anchor):
+        """w:p element of an anchor, or None.
+        
+        If the element path no longer matches, a paragraph with the same
+        text is used as long as that text is unique in the document.
+        """
+        p = self.anchors.get(anchor)
+        if p is None:
+            p = self.text_hashes.get(anchor.rpartition(':')[2])
+        return p
+
+    def save(self, output_file):
+        self.doc.save(output_file)
+
+def load_document(source):
+    """Return a ParsedDocument for a DOCX path or python-docx Document, or `source` itself if already parsed"""
+    if isinstance(source, ParsedDocument):
+        return source
+    if isinstance(source, DocxDocument):
+        # Wrapped rather than copied, so edits go to the caller's Document
+        return ParsedDocument(None, source)
+    return ParsedDocument(source)
+
+def is_docx(path):
+    return os.path.splitext(path)[1].lower() == '.docx'
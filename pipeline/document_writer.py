@@ -1,7 +1,17 @@
-import re
 import json
-from docx import Document
-from docx.shared import Pt, RGBColor, Inches
+from copy import deepcopy
+from collections import defaultdict
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import qn, nsdecls
+from docx.shared import Pt, RGBColor, Inches, Emu
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from document_model import load_document
+from style_resolver import StyleResolver
+from question_similarity import AnswerMatcher, DEFAULT_MATCH_THRESHOLD
+from answer_markup import answer_markup, parse_paragraph, parse_table
 
 def apply_base_formatting(run, format_info):
     """Apply base formatting (font name, size, color) to a run"""
@@ -25,93 +35,149 @@ def apply_base_formatting(run, format_info):
                 # If there's an error parsing the color, skip it
                 pass
 
-def apply_formatting_to_paragraph(paragraph, text, format_info):
-    """Function to parse the formatted answer and apply proper Word formatting"""
-    # Process for bullet points - manually create bullet effect without using styles
-    if text.startswith('•'):
-        paragraph.paragraph_format.left_indent = Inches(0.25)
-        paragraph.paragraph_format.first_line_indent = Inches(-0.25)
-        text = text[1:].strip()
-        # Add a bullet character at the beginning
-        run = paragraph.add_run('• ')
-        apply_base_formatting(run, format_info)
-    
-    # Look for formatting tags
-    remaining_text = text
-    position = 0
-    
-    # If the text starts with a bullet, we've already processed it
-    if text.startswith('•'):
-        remaining_text = text[1:].strip()
-    
-    while position < len(remaining_text):
-        # Look for the next formatting tag
-        bold_start = remaining_text.find('<b>', position)
-        italic_start = remaining_text.find('<i>', position)
-        bold_italic_start = remaining_text.find('<bi>', position)
-        
-        # Find the earliest tag
-        next_tag_position = min(
-            bold_start if bold_start != -1 else float('inf'),
-            italic_start if italic_start != -1 else float('inf'),
-            bold_italic_start if bold_italic_start != -1 else float('inf')
+ANSWER_HEADING_STYLE = "Answer Heading"
+ANSWER_BODY_STYLE = "Answer Body"
+ANSWER_BULLET_STYLE = "Answer Bullet"
+ANSWER_LABEL_COLOR = RGBColor(0, 102, 0)  # Green color for "Answer:" text
+
+def setup_heading_style(style):
+    style.paragraph_format.space_before = Pt(12)
+    style.font.bold = True
+    style.font.color.rgb = ANSWER_LABEL_COLOR
+
+def setup_body_style(style):
+    style.paragraph_format.left_indent = Pt(20)
+
+def setup_bullet_style(style):
+    style.paragraph_format.left_indent = Inches(0.25)
+    style.paragraph_format.first_line_indent = Inches(-0.25)
+
+# w:tblLook attributes of a new python-docx table
+TABLE_LOOK = (
+    ('firstColumn', '1'), ('firstRow', '1'), ('lastColumn', '0'),
+    ('lastRow', '0'), ('noHBand', '0'), ('noVBand', '1'), ('val', '04A0'),
+)
+
+# Paragraph and table properties of Word's built-in 'Table Grid' style
+TABLE_GRID_PPR = f'<w:pPr {nsdecls("w")}><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr>'
+TABLE_GRID_TBLPR = (
+    f'<w:tblPr {nsdecls("w")}><w:tblBorders>'
+    + ''.join(f'<w:{edge} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+              for edge in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV'))
+    + '</w:tblBorders></w:tblPr>'
+)
+
+ANSWER_STYLES = (
+    (ANSWER_HEADING_STYLE, setup_heading_style),
+    (ANSWER_BODY_STYLE, setup_body_style),
+    (ANSWER_BULLET_STYLE, setup_bullet_style),
+)
+
+def answer_styles(doc):
+    """Style ids of the answer paragraph styles, adding the styles to the document if missing"""
+    styles = doc.styles
+    base_style = styles.default(WD_STYLE_TYPE.PARAGRAPH)
+    style_ids = {}
+    for name, setup in ANSWER_STYLES:
+        try:
+            style = styles[name]
+        except KeyError:
+            style = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+            style.base_style = base_style
+            setup(style)
+        style_ids[name] = style.style_id
+    return style_ids
+
+def table_grid_style(doc):
+    """The document's 'Table Grid' style, added with Word's single-line grid borders if missing.
+    
+    Word only writes the style to styles.xml once a table in the document
+    uses it, so many manuals don't define it.
+    """
+    styles = doc.styles
+    try:
+        return styles['Table Grid']
+    except KeyError:
+        pass
+    style = styles.add_style('Table Grid', WD_STYLE_TYPE.TABLE)
+    # It is a built-in style, not a custom one
+    style.element.attrib.pop(qn('w:customStyle'), None)
+    try:
+        style.base_style = styles['Normal Table']
+    except KeyError:
+        pass
+    style.element.append(parse_xml(TABLE_GRID_PPR))
+    style.element.append(parse_xml(TABLE_GRID_TBLPR))
+    return style
+
+class AnswerFormatter:
+    """Formatting shared by every answer written into one document.
+    
+    The answer paragraph styles are looked up (or added) once, and one
+    w:rPr template is built per distinct run format, then deep-copied onto
+    each new run. This avoids setting font properties one at a time through
+    python-docx and resolving style names for every paragraph. Font
+    properties the answer styles already inherit from the default
+    paragraph style are left out of the templates.
+    """
+    
+    def __init__(self, doc, styles=None):
+        self.doc = doc
+        self.style_ids = answer_styles(doc)
+        self._table_style_id = None
+        styles = styles or StyleResolver.from_document(doc)
+        self.inherited = styles.style_pair_properties(
+            styles.default_styles.get('paragraph'), styles.default_styles.get('character')
         )
-        
-        if next_tag_position == float('inf'):
-            # No more tags, add the remaining text as regular
-            if position < len(remaining_text):
-                run = paragraph.add_run(remaining_text[position:])
-                apply_base_formatting(run, format_info)
-            break
-        
-        # Add text before the tag
-        if next_tag_position > position:
-            run = paragraph.add_run(remaining_text[position:next_tag_position])
-            apply_base_formatting(run, format_info)
-        
-        # Process the tag
-        if next_tag_position == bold_start:
-            end_tag = remaining_text.find('</b>', bold_start)
-            if end_tag != -1:
-                content = remaining_text[bold_start+3:end_tag]
-                run = paragraph.add_run(content)
-                apply_base_formatting(run, format_info)
-                run.bold = True
-                position = end_tag + 4  # Move past </b>
-            else:
-                # Malformed tag, treat as plain text
-                run = paragraph.add_run(remaining_text[position:])
-                apply_base_formatting(run, format_info)
-                break
-                
-        elif next_tag_position == italic_start:
-            end_tag = remaining_text.find('</i>', italic_start)
-            if end_tag != -1:
-                content = remaining_text[italic_start+3:end_tag]
-                run = paragraph.add_run(content)
-                apply_base_formatting(run, format_info)
-                run.italic = True
-                position = end_tag + 4  # Move past </i>
-            else:
-                # Malformed tag, treat as plain text
-                run = paragraph.add_run(remaining_text[position:])
-                apply_base_formatting(run, format_info)
-                break
-                
-        elif next_tag_position == bold_italic_start:
-            end_tag = remaining_text.find('</bi>', bold_italic_start)
-            if end_tag != -1:
-                content = remaining_text[bold_italic_start+4:end_tag]
-                run = paragraph.add_run(content)
-                apply_base_formatting(run, format_info)
+        self.templates = {}
+    
+    def run_template(self, format_info, bold=False, italic=False, color=True):
+        """w:rPr element (or None) for a run format; `color` False leaves the color to the style"""
+        font = {
+            name: format_info.get(name)
+            for name in ('font_name', 'font_size', 'font_color')
+            if format_info.get(name) != self.inherited.get(name) and (color or name != 'font_color')
+        }
+        key = (font.get('font_name'), font.get('font_size'), font.get('font_color'), bold, italic)
+        if key not in self.templates:
+            run = Run(OxmlElement('w:r'), None)
+            apply_base_formatting(run, font)
+            if bold:
                 run.bold = True
+            if italic:
                 run.italic = True
-                position = end_tag + 5  # Move past </bi>
-            else:
-                # Malformed tag, treat as plain text
-                run = paragraph.add_run(remaining_text[position:])
-                apply_base_formatting(run, format_info)
-                break
+            self.templates[key] = run._r.rPr
+        return self.templates[key]
+    
+    def add_run(self, paragraph, text, format_info, bold=False, italic=False, color=True):
+        """Append a run with `text` to a paragraph, formatted from the matching template"""
+        r = paragraph._p.add_r()
+        r.text = text
+        template = self.run_template(format_info, bold, italic, color)
+        if template is not None:
+            r.insert(0, deepcopy(template))
+        return r
+    
+    @property
+    def table_style_id(self):
+        """Style id of 'Table Grid', looked up (or added) when the first table is written"""
+        if self._table_style_id is None:
+            self._table_style_id = table_grid_style(self.doc).style_id
+        return self._table_style_id
+    
+    def set_style(self, paragraph, name):
+        paragraph._p.style = self.style_ids[name]
+
+def render_paragraph(paragraph, block, format_info, formatter):
+    """Add a parsed paragraph block (bullet and styled runs, see answer_markup) to a paragraph"""
+    # Bullets get a hanging indent from the answer bullet style
+    if block["bullet"]:
+        formatter.set_style(paragraph, ANSWER_BULLET_STYLE)
+        # Add a bullet character at the beginning
+        formatter.add_run(paragraph, '• ', format_info)
+    
+    for text, style in block["runs"]:
+        formatter.add_run(paragraph, text, format_info, 'b' in style, 'i' in style)
     
     # Set paragraph alignment if specified
     if format_info.get('alignment'):
@@ -124,155 +190,194 @@ def apply_formatting_to_paragraph(paragraph, text, format_info):
             # If there's an error parsing the alignment, skip it
             pass
 
-def create_table_from_description(doc, table_desc, format_info):
+def apply_formatting_to_paragraph(paragraph, text, format_info, formatter=None):
+    """Function to parse the formatted answer and apply proper Word formatting"""
+    formatter = formatter or AnswerFormatter(paragraph.part.document)
+    render_paragraph(paragraph, parse_paragraph(text), format_info, formatter)
+
+def create_table(doc, rows, format_info, formatter):
+    """Table built as a w:tbl element in one pass from parsed rows of cell paragraph blocks.
+    
+    The table has as many columns as its widest row; shorter rows are
+    padded with empty cells. The element is not attached to the body.
+    """
+    num_cols = max(len(cells) for cells in rows)
+    col_width = str(Emu(doc._block_width // num_cols).twips)
+    
+    tbl = OxmlElement('w:tbl')
+    tblPr = OxmlElement('w:tblPr')
+    tblPr.append(OxmlElement('w:tblStyle', {qn('w:val'): formatter.table_style_id}))
+    tblPr.append(OxmlElement('w:tblW', {qn('w:type'): 'auto', qn('w:w'): '0'}))
+    tblPr.append(OxmlElement('w:tblLook', {qn(f'w:{name}'): value for name, value in TABLE_LOOK}))
+    tbl.append(tblPr)
+    tblGrid = OxmlElement('w:tblGrid')
+    for _ in range(num_cols):
+        tblGrid.append(OxmlElement('w:gridCol', {qn('w:w'): col_width}))
+    tbl.append(tblGrid)
+    
+    tcPr = OxmlElement('w:tcPr')
+    tcPr.append(OxmlElement('w:tcW', {qn('w:type'): 'dxa', qn('w:w'): col_width}))
+    for cells in rows:
+        tr = OxmlElement('w:tr')
+        for j in range(num_cols):
+            tc = OxmlElement('w:tc')
+            tc.append(deepcopy(tcPr))
+            # Every cell needs a paragraph, even the padding ones
+            p = OxmlElement('w:p')
+            tc.append(p)
+            if j < len(cells):
+                render_paragraph(Paragraph(p, doc._body), cells[j], format_info, formatter)
+            tr.append(tc)
+        tbl.append(tr)
+    
+    return Table(tbl, doc._body)
+
+def create_table_from_description(doc, table_desc, format_info, formatter=None):
     """Process table formatting"""
     # Parse table description: row1col1|row1col2;row2col1|row2col2
-    rows = table_desc.split(';')
-    num_rows = len(rows)
-    num_cols = len(rows[0].split('|'))
-    
-    table = doc.add_table(rows=num_rows, cols=num_cols)
-    table.style = 'Table Grid'
-    
-    for i, row_text in enumerate(rows):
-        cells = row_text.split('|')
-        for j, cell_text in enumerate(cells):
-            if j < num_cols:  # Ensure we don't exceed column count
-                cell = table.cell(i, j)
-                paragraph = cell.paragraphs[0]
-                apply_formatting_to_paragraph(paragraph, cell_text.strip(), format_info)
-                
-    return table
+    return create_table(doc, parse_table(table_desc), format_info, formatter or AnswerFormatter(doc))
+
+def question_locations(document, qa_data):
+    """w:p element (or None) of each saved question.
+    
+    Questions are located by anchor in O(1). Answer files from before
+    anchors existed carry indexes into doc.paragraphs instead.
+    """
+    if "question_anchors" in qa_data:
+        return [document.locate(anchor) for anchor in qa_data["question_anchors"]]
+    paragraphs = document.paragraphs
+    return [paragraphs[i]._p if 0 <= i < len(paragraphs) else None for i in qa_data.get("question_indices", [])]
+
+def new_paragraph(doc):
+    """A paragraph not yet attached to the body; apply_insertion_plan places it"""
+    return Paragraph(OxmlElement('w:p'), doc._body)
 
-def insert_answers_in_document(doc, qa_data):
-    """Insert answers into the document using the saved question-answer data"""
+def answer_elements(doc, blocks, format_info, formatter):
+    """Detached elements (heading, answer blocks, blank line) for one parsed answer"""
+    elements = []
+    
+    # Create a new paragraph for "Answer:" heading, which is bold and green by its style
+    p_answer_heading = new_paragraph(doc)
+    formatter.set_style(p_answer_heading, ANSWER_HEADING_STYLE)
+    
+    # Apply the same font as the question to the "Answer:" label
+    formatter.add_run(p_answer_heading, "Answer: ", format_info, color=False)
+    elements.append(p_answer_heading._p)
+    
+    # Process answer blocks with appropriate formatting
+    for block in blocks:
+        if block["type"] == "table":
+            table = create_table(doc, block["rows"], format_info, formatter)
+            elements.append(table._tbl)
+            continue
+            
+        if block["type"] == "diagram":
+            p_diagram = new_paragraph(doc)
+            formatter.add_run(p_diagram, "[Diagram: " + block["text"] + "]", format_info, italic=True)
+            elements.append(p_diagram._p)
+            continue
+        
+        # Regular paragraph with potential formatting; bullets get their own style
+        p_answer = new_paragraph(doc)
+        if not block["bullet"]:
+            formatter.set_style(p_answer, ANSWER_BODY_STYLE)
+        
+        render_paragraph(p_answer, block, format_info, formatter)
+        elements.append(p_answer._p)
+    
+    # Add a blank line after the answer
+    elements.append(new_paragraph(doc)._p)
+    return elements
+
+def apply_insertion_plan(plan):
+    """Insert the planned elements after their anchor elements.
+    
+    `plan` maps an anchor element to the new elements that follow it. The
+    children of each affected parent (the body, or a table cell) are
+    rebuilt once, so applying the plan is linear in the document size
+    instead of shifting the child list on every insert.
+    """
+    by_parent = defaultdict(dict)
+    for anchor, elements in plan.items():
+        by_parent[anchor.getparent()][anchor] = elements
+    
+    for parent, inserts in by_parent.items():
+        children = []
+        for child in parent:
+            children.append(child)
+            children.extend(inserts.get(child, ()))
+        parent[:] = children
+
+def insert_answers_in_document(doc, qa_data, match_threshold=DEFAULT_MATCH_THRESHOLD):
+    """Insert answers into the document using the saved question-answer data.
+    
+    `doc` is a python-docx Document or a ParsedDocument, edited in place,
+    or a DOCX path (see load_document). Each question paragraph gets the
+    answer of the best matching answered question (see AnswerMatcher), if
+    its similarity reaches `match_threshold`. New elements are built
+    detached and collected per question in an insertion plan, which is
+    applied to the document in a single pass.
+    """
+    document = load_document(doc)
+    doc = document.doc
+    formatter = AnswerFormatter(doc, document.styles)
     # Extract data from the qa_data
     qa_pairs = qa_data.get("qa_pairs", [])
-    question_indices = qa_data.get("question_indices", [])
+    question_elements = question_locations(document, qa_data)
     question_texts = qa_data.get("question_texts", [])
     question_formats = qa_data.get("question_formats", [])
     
-    # Create a mapping of questions to answers
-    qa_map = {qa["question"].strip(): qa["answer"] for qa in qa_pairs}
+    # Index the answered questions once for exact and fuzzy lookups
+    matcher = AnswerMatcher(((qa["question"].strip(), qa) for qa in qa_pairs), match_threshold)
     
-    modified = False
+    plan = {}
     insertions = 0
     
     # Process each question paragraph
-    for idx, (question_text, format_info) in enumerate(zip(question_texts, question_formats)):
-        question_index = question_indices[idx]
+    for question_element, question_text, format_info in zip(question_elements, question_texts, question_formats):
+        if question_element is None:
+            print(f"Could not locate question in the document: {question_text[:50]}...")
+            continue
         
         # Find the matching answer
-        matching_answer = None
-        matching_question = None
-        
-        # Try to find an exact match first
-        if question_text in qa_map:
-            matching_answer = qa_map[question_text]
-            matching_question = question_text
-        else:
-            # Try to find a fuzzy match
-            for q in qa_map:
-                # Check if the current question is similar to any in our map
-                if question_text in q or q in question_text:
-                    matching_answer = qa_map[q]
-                    matching_question = q
-                    break
+        match = matcher.match(question_text)
+        matching_qa = match[1] if match else None
         
-        if matching_answer:
-            # Force insert answer after the question
+        if matching_qa and matching_qa["answer"]:
+            # Plan the answer right after the question, from the markup stored with it
             print(f"Inserting answer after: {question_text[:50]}...")
-            
-            # Create a new paragraph for "Answer:" heading
-            p_answer_heading = doc.add_paragraph()
-            doc._body._body.insert(question_index + 1, p_answer_heading._p)
-            p_answer_heading.style = 'Normal'  # Use Normal style which should exist in every document
-            p_answer_heading.paragraph_format.space_before = Pt(12)
-            
-            # Apply the same formatting as the question to the "Answer:" label
-            r_answer_heading = p_answer_heading.add_run("Answer: ")
-            apply_base_formatting(r_answer_heading, format_info)
-            r_answer_heading.bold = True
-            r_answer_heading.font.color.rgb = RGBColor(0, 102, 0)  # Green color for "Answer:" text
-            
-            # Current insertion position
-            current_pos = question_index + 2
-            
-            # Process answer text with appropriate formatting
-            answer_lines = matching_answer.split('\n')
-            for line in answer_lines:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                # Check for table
-                table_match = re.search(r'<table>(.*?)</table>', line)
-                if table_match:
-                    table_desc = table_match.group(1)
-                    table = create_table_from_description(doc, table_desc, format_info)
-                    doc._body._body.insert(current_pos, table._tbl)
-                    current_pos += 1
-                    continue
-                    
-                # Check for diagram placeholder
-                diagram_match = re.search(r'<diagram>(.*?)</diagram>', line)
-                if diagram_match:
-                    p_diagram = doc.add_paragraph()
-                    doc._body._body.insert(current_pos, p_diagram._p)
-                    r_diagram = p_diagram.add_run("[Diagram: " + diagram_match.group(1) + "]")
-                    apply_base_formatting(r_diagram, format_info)
-                    r_diagram.italic = True
-                    current_pos += 1
-                    continue
-                
-                # Regular paragraph with potential formatting
-                p_answer = doc.add_paragraph()
-                doc._body._body.insert(current_pos, p_answer._p)
-                p_answer.style = 'Normal'  # Use Normal style which should exist in every document
-                
-                # If not a bullet point, add indentation
-                if not line.startswith('•'):
-                    p_answer.paragraph_format.left_indent = Pt(20)
-                
-                # Apply formatting to the text
-                apply_formatting_to_paragraph(p_answer, line, format_info)
-                current_pos += 1
-            
-            # Add a blank line after the answer
-            p_blank = doc.add_paragraph()
-            doc._body._body.insert(current_pos, p_blank._p)
-            current_pos += 1
-            
-            modified = True
+            blocks = answer_markup(matching_qa["answer"], matching_qa.get("markup"))["blocks"]
+            plan.setdefault(question_element, []).extend(answer_elements(doc, blocks, format_info, formatter))
             insertions += 1
-            
-            # Adjust subsequent indices to account for insertions
-            offset = current_pos - (question_index + 1)
-            for j in range(len(question_indices)):
-                if question_indices[j] > question_index:
-                    question_indices[j] += offset
     
+    apply_insertion_plan(plan)
     print(f"Inserted {insertions} answers into the document.")
-    return modified
+    return insertions > 0
 
-def write_answers_to_document(input_file, answers_json, output_file):
-    """Insert answers from JSON into the document and save as a new file"""
+def write_answers_to_document(input_file, answers_json, output_file, document=None,
+                              match_threshold=DEFAULT_MATCH_THRESHOLD):
+    """Insert answers from JSON into the document and save as a new file.
+    
+    `document` is the ParsedDocument already built during extraction; when
+    it is None the input file is parsed here. `match_threshold` is the
+    minimum similarity for placing an answer under an inexact question.
+    """
     print(f"Loading document: {input_file}")
     print(f"Loading answers from: {answers_json}")
     
-    # Load the document
-    doc = Document(input_file)
+    # Load the document (reusing the parse from extraction when given)
+    document = load_document(document or input_file)
     
     # Load the answers data
     with open(answers_json, 'r', encoding='utf-8') as f:
         qa_data = json.load(f)
     
     # Insert answers into the document
-    modified = insert_answers_in_document(doc, qa_data)
+    modified = insert_answers_in_document(document, qa_data, match_threshold)
     
     if modified:
         # Save the modified document
-        doc.save(output_file)
+        document.save(output_file)
         print(f"Successfully created document with answers: {output_file}")
         return True
     else:
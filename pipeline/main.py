@@ -2,12 +2,32 @@
 import os
 import asyncio
 import argparse
-from question_extractor import extract_and_save_questions
-from answer_generator import update_answers
+from question_extractor import extract_and_save_questions, load_question_data
+from context_store import has_context, missing_context_message
+from pdf_extractor import DEFAULT_PAGE_CACHE_PATH
+from answer_generator import (
+    update_answers, RequestScheduler, DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE, DEFAULT_MAX_RETRIES, DEFAULT_RETRY_BUDGET, DEFAULT_REQUEST_TIMEOUT
+)
+from answer_cache import AnswerCache, DEFAULT_CACHE_PATH
+from question_similarity import QuestionIndex, DEFAULT_INDEX_PATH, DEFAULT_SIMILARITY_THRESHOLD, DEFAULT_MATCH_THRESHOLD
+from answer_backends import BACKENDS, DEFAULT_GEMINI_MODEL, create_backend
 from document_writer import write_answers_to_document
+from document_model import load_document, is_docx
 
-async def process_lab_manual(input_file, output_file, questions_json=None, answers_json=None):
-    """Process a lab manual document end-to-end"""
+async def process_lab_manual(input_file, output_file, questions_json=None, answers_json=None, extraction_options=None,
+                             match_threshold=DEFAULT_MATCH_THRESHOLD, **generation_options):
+    """Process a lab manual document end-to-end.
+    
+    `extraction_options` (streaming, pdf_workers, page_cache) are passed to
+    extract_and_save_questions; with `streaming`, DOCX questions are read by
+    streaming the document XML and the manual is only fully loaded for
+    writing. `match_threshold` is passed to write_answers_to_document.
+    `generation_options` (concurrency, scheduler, cache, batch_size,
+    backend, context_session, question_index) are passed through to
+    update_answers.
+    """
+    extraction_options = extraction_options or {}
     # Set default filenames if not provided
     if questions_json is None:
         questions_json = "questions_data.json"
@@ -21,23 +41,27 @@ async def process_lab_manual(input_file, output_file, questions_json=None, answe
     print(f"Answers data: {answers_json}")
     print("==================================")
     
+    # Parse a DOCX manual once; extraction and writing share the same tree
+    streaming = extraction_options.get("streaming", False)
+    document = load_document(input_file) if is_docx(input_file) and not streaming else None
+    
     # Step 1: Extract questions from the document
     print("\nStep 1: Extracting questions...")
-    success = extract_and_save_questions(input_file, questions_json)
+    success = extract_and_save_questions(input_file, questions_json, document, **extraction_options)
     if not success:
         print("Failed to extract questions. Aborting.")
         return False
     
     # Step 2: Generate answers (only for new questions)
     print("\nStep 2: Generating answers...")
-    success = await update_answers(questions_json, answers_json)
+    success = await update_answers(questions_json, answers_json, **generation_options)
     if not success:
         print("Failed to generate answers. Aborting.")
         return False
     
     # Step 3: Write answers to the document
     print("\nStep 3: Writing answers to document...")
-    success = write_answers_to_document(input_file, answers_json, output_file)
+    success = write_answers_to_document(input_file, answers_json, output_file, document, match_threshold)
     if not success:
         print("Failed to write answers to document.")
         return False
@@ -56,8 +80,68 @@ def setup_argparse():
     parser.add_argument('--extract-only', action='store_true', help='Only extract questions, don\'t generate answers')
     parser.add_argument('--generate-only', action='store_true', help='Only generate answers, don\'t modify document')
     parser.add_argument('--write-only', action='store_true', help='Only write answers to document, don\'t extract or generate')
+    parser.add_argument('--low-memory', action='store_true', help='Extract DOCX questions by streaming the document XML instead of loading the whole file')
+    parser.add_argument('--pdf-workers', type=int, default=None, help='Processes used to extract PDF pages (default: CPU count)')
+    parser.add_argument('--page-cache', default=DEFAULT_PAGE_CACHE_PATH, help='SQLite file caching extracted PDF page text')
+    parser.add_argument('--no-page-cache', action='store_true', help='Don\'t use the PDF page cache')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='gemini', help='Answer backend (local and synthetic run offline)')
+    parser.add_argument('--model', default=DEFAULT_GEMINI_MODEL, help='Gemini model name')
+    parser.add_argument('--temperature', type=float, default=None, help='Sampling temperature for the Gemini backend')
+    parser.add_argument('--max-output-tokens', type=int, default=None, help='Maximum tokens per Gemini response')
+    parser.add_argument('--synthetic-latency', type=float, default=1.0, help='Mean latency in seconds of the synthetic backend')
+    parser.add_argument('--synthetic-error-rate', type=float, default=0.0, help='Fraction of synthetic backend calls that fail with a 429/503')
+    parser.add_argument('--concurrency', '-c', type=int, default=DEFAULT_CONCURRENCY, help='Maximum number of answer requests in flight at once')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help='Requests-per-minute quota for the answer backend')
+    parser.add_argument('--tpm', type=int, default=DEFAULT_TOKENS_PER_MINUTE, help='Tokens-per-minute quota for the answer backend')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES, help='Maximum retries per request on quota or server errors')
+    parser.add_argument('--retry-budget', type=int, default=DEFAULT_RETRY_BUDGET, help='Maximum retries across the whole run')
+    parser.add_argument('--request-timeout', type=float, default=DEFAULT_REQUEST_TIMEOUT, help='Seconds before an answer request is cancelled and retried (0 disables the deadline)')
+    parser.add_argument('--hedge', action='store_true', help='Send a duplicate request when a call runs slower than the observed p90 latency')
+    parser.add_argument('--batch-size', type=int, default=1, help='Number of questions packed into each answer request (1 disables batching)')
+    parser.add_argument('--context-session', action='store_true', help='Register the whole manual with the backend once instead of sending retrieved chunks with every prompt (every prompt is then billed for the whole manual at the cached rate, which costs more than retrieval unless the manual is short)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='SQLite file used to cache generated answers')
+    parser.add_argument('--no-cache', action='store_true', help='Don\'t use the answer cache')
+    parser.add_argument('--question-index', default=DEFAULT_INDEX_PATH, help='SQLite file indexing answered questions for near-duplicate reuse')
+    parser.add_argument('--similarity-threshold', type=float, default=DEFAULT_SIMILARITY_THRESHOLD, help='Minimum similarity for reusing the answer of a near-duplicate question')
+    parser.add_argument('--no-near-duplicates', action='store_true', help='Always generate answers for questions without an exact cache hit')
+    parser.add_argument('--match-threshold', type=float, default=DEFAULT_MATCH_THRESHOLD, help='Minimum similarity for writing an answer under a question that doesn\'t match it exactly')
     return parser
 
+def build_extraction_options(args):
+    """Question extraction settings selected on the command line"""
+    return {
+        "streaming": args.low_memory,
+        "pdf_workers": args.pdf_workers,
+        # Opened only once a PDF is actually extracted
+        "page_cache": None if args.no_page_cache else args.page_cache
+    }
+
+def build_generation_options(args):
+    """Create the answer generation components selected on the command line"""
+    if args.backend == 'gemini':
+        generation_config = {}
+        if args.temperature is not None:
+            generation_config["temperature"] = args.temperature
+        if args.max_output_tokens is not None:
+            generation_config["max_output_tokens"] = args.max_output_tokens
+        backend = create_backend('gemini', model_name=args.model, generation_config=generation_config)
+    elif args.backend == 'synthetic':
+        backend = create_backend('synthetic', latency_mean=args.synthetic_latency, error_rate=args.synthetic_error_rate)
+    else:
+        backend = create_backend(args.backend)
+    
+    return {
+        "concurrency": args.concurrency,
+        "scheduler": RequestScheduler(
+            args.rpm, args.tpm, args.max_retries, args.retry_budget, args.request_timeout, args.hedge
+        ),
+        "cache": None if args.no_cache else AnswerCache(args.cache),
+        "batch_size": args.batch_size,
+        "backend": backend,
+        "context_session": args.context_session,
+        "question_index": None if args.no_near_duplicates else QuestionIndex(args.question_index, args.similarity_threshold)
+    }
+
 async def main():
     parser = setup_argparse()
     args = parser.parse_args()
@@ -70,7 +154,7 @@ async def main():
     if args.extract_only:
         # Only extract questions
         print("Extracting questions only...")
-        return extract_and_save_questions(args.input, args.questions)
+        return extract_and_save_questions(args.input, args.questions, **build_extraction_options(args))
         
     elif args.generate_only:
         # Only generate answers
@@ -78,7 +162,10 @@ async def main():
         if not os.path.exists(args.questions):
             print(f"Error: Questions file '{args.questions}' not found.")
             return False
-        return await update_answers(args.questions, args.answers)
+        if not has_context(load_question_data(args.questions), args.questions):
+            print(missing_context_message(args.questions))
+            return False
+        return await update_answers(args.questions, args.answers, **build_generation_options(args))
         
     elif args.write_only:
         # Only write answers to document
@@ -86,11 +173,14 @@ async def main():
         if not os.path.exists(args.answers):
             print(f"Error: Answers file '{args.answers}' not found.")
             return False
-        return write_answers_to_document(args.input, args.answers, args.output)
+        return write_answers_to_document(args.input, args.answers, args.output, match_threshold=args.match_threshold)
         
     else:
         # Process everything
-        return await process_lab_manual(args.input, args.output, args.questions, args.answers)
+        return await process_lab_manual(
+            args.input, args.output, args.questions, args.answers, build_extraction_options(args),
+            args.match_threshold, **build_generation_options(args)
+        )
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF for PDF extraction
+
+DEFAULT_PAGE_CACHE_PATH = "pdf_page_cache.sqlite3"
+DEFAULT_PAGE_CACHE_MAX_ENTRIES = 20000
+# Pages handed to a worker at a time
+PAGE_CHUNK_SIZE = 16
+# Plain text only: no image blocks, same output as page.get_text()
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT
+# Bumped when the extraction flags or page keys change so old cached text is not reused
+PAGE_CACHE_VERSION = '2'
+
+REFERENCE_PATTERN = re.compile(r'(\d+) 0 R')
+# Links back up or across the page tree, which don't change a page's text
+IGNORED_KEY_PATTERN = re.compile(r'/(?:Parent|P|Annots|StructParents?|B)\s+(?:\d+ 0 R|\d+|\[[^\]]*\])')
+# Page attributes a page can inherit from its ancestors in the page tree
+INHERITED_PAGE_KEYS = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
+
+def object_hash(doc, xref, memo):
+    """Hash of a PDF object and everything it references.
+
+    References are replaced by the hash of the object they point to, so
+    the result depends on content (content streams, form XObjects, fonts,
+    ToUnicode maps...) and not on xref numbers, which change when a file
+    is re-saved. `memo` holds the hashes already computed for `doc`.
+    """
+    if xref in memo:
+        return memo[xref]
+    # Stands in for the object while it is being hashed, should it reference itself
+    memo[xref] = b'cycle'
+    digest = hashlib.sha256()
+    source = IGNORED_KEY_PATTERN.sub('', doc.xref_object(xref, compressed=True))
+    for i, part in enumerate(REFERENCE_PATTERN.split(source)):
+        digest.update(object_hash(doc, int(part), memo) if i % 2 else part.encode('utf-8'))
+    # None for objects without a stream
+    digest.update(doc.xref_stream_raw(xref) or b'')
+    memo[xref] = digest.digest()
+    return memo[xref]
+
+def _inline_hash(doc, value, memo):
+    """A direct object value with its references replaced by object hashes"""
+    return REFERENCE_PATTERN.sub(lambda m: object_hash(doc, int(m.group(1)), memo).hex(), value)
+
+def page_key(page, memo=None):
+    """Hash of what determines a page's text.
+
+    Covers the page object and everything it reaches (content streams,
+    XObjects, fonts and their encodings), plus the attributes it inherits
+    from the page tree.
+    """
+    doc = page.parent
+    memo = {} if memo is None else memo
+    digest = hashlib.sha256(PAGE_CACHE_VERSION.encode('utf-8'))
+    digest.update(object_hash(doc, page.xref, memo))
+    for key in INHERITED_PAGE_KEYS:
+        xref = page.xref
+        kind, value = doc.xref_get_key(xref, key)
+        # Walk up the page tree until an ancestor defines the attribute
+        while kind == 'null':
+            parent_kind, parent = doc.xref_get_key(xref, 'Parent')
+            if parent_kind != 'xref':
+                break
+            xref = int(parent.split()[0])
+            kind, value = doc.xref_get_key(xref, key)
+        digest.update(f"\0{key}\0{kind}\0".encode('utf-8'))
+        if kind == 'xref':
+            digest.update(object_hash(doc, int(value.split()[0]), memo))
+        else:
+            digest.update(_inline_hash(doc, value, memo).encode('utf-8'))
+    return digest.hexdigest()
+
+def extract_pages(doc, page_numbers, cache=None):
+    """(key, text, cached) for some pages of an open PDF.
+
+    With a cache, each page is hashed first and only pages missing from the
+    cache are extracted; `key` is None without a cache.
+    """
+    pages = [doc[n] for n in page_numbers]
+    if cache is None:
+        return [(None, page.get_text(flags=TEXT_FLAGS), False) for page in pages]
+    # Fonts and other resources shared between pages are hashed once
+    memo = {}
+    keys = [page_key(page, memo) for page in pages]
+    cached = cache.get_many(keys)
+    return [
+        (key, cached[key], True) if key in cached else (key, page.get_text(flags=TEXT_FLAGS), False)
+        for key, page in zip(keys, pages)
+    ]
+
+def extract_page_range(pdf_path, page_numbers, cache_path=None):
+    """extract_pages for a worker process, which opens its own document and cache"""
+    cache = PageTextCache(cache_path) if cache_path else None
+    try:
+        with fitz.open(pdf_path) as doc:
+            return extract_pages(doc, page_numbers, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+class PageTextCache:
+    """SQLite cache of extracted page text keyed by page content hash.
+
+    Re-extracting a manual, or a new edition sharing most of its pages,
+    only runs text extraction for pages whose content changed.
+    """
+
+    def __init__(self, path=DEFAULT_PAGE_CACHE_PATH, max_entries=DEFAULT_PAGE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_created ON pages (created)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Cached text for the given keys, as a dict"""
+        found = {}
+        unique = list(set(keys))
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT key, text FROM pages WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pages (key, text, created) VALUES (?, ?, ?)",
+            [(key, text, now) for key, text in items]
+        )
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        """Drop the oldest pages beyond `max_entries`"""
+        count = self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self.conn.execute(
+            "DELETE FROM pages WHERE key IN (SELECT key FROM pages ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def close(self):
+        self.conn.close()
+
+def iter_pdf_page_texts(pdf_path, workers=None, cache=None):
+    """Yield the text of each page of a PDF in page order.
+
+    Pages are hashed, looked up in `cache` and, when missing, extracted by a
+    process pool in chunks of PAGE_CHUNK_SIZE. Each page is yielded as soon
+    as its chunk and every chunk before it are done, so callers can start
+    working before the last page is read. `workers` defaults to the CPU
+    count; 1 extracts in-process. `cache` is a PageTextCache or the path
+    of one, opened here so runs that extract no PDF never create it.
+    """
+    if isinstance(cache, str):
+        cache = PageTextCache(cache)
+        try:
+            yield from iter_pdf_page_texts(pdf_path, workers, cache)
+        finally:
+            cache.close()
+        return
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        chunks = [range(i, min(i + PAGE_CHUNK_SIZE, page_count)) for i in range(0, page_count, PAGE_CHUNK_SIZE)]
+        workers = min(workers or os.cpu_count() or 1, len(chunks))
+
+        def in_page_order(chunk_results):
+            for results in chunk_results:
+                if cache is not None:
+                    new_pages = [(key, text) for key, text, cached in results if not cached]
+                    cache.hits += len(results) - len(new_pages)
+                    cache.misses += len(new_pages)
+                    if new_pages:
+                        cache.put_many(new_pages)
+                for _, text, _ in results:
+                    yield text
+
+        if workers <= 1:
+            yield from in_page_order(extract_pages(doc, chunk, cache) for chunk in chunks)
+            return
+        # Workers look pages up in the cache themselves; only the parent writes to it
+        cache_path = cache.path if cache is not None else None
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps chunk order while later chunks extract in the background
+            yield from in_page_order(pool.map(
+                extract_page_range, [pdf_path] * len(chunks), chunks, [cache_path] * len(chunks)
+            ))
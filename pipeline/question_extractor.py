@@ -1,155 +1,492 @@
 import re
 import json
 import os
-from docx import Document
-import fitz  # PyMuPDF for PDF extraction
+import difflib
+import hashlib
+import zipfile
+from lxml import etree
+from document_model import load_document, iter_body_paragraphs, make_anchor, ANCHOR_CONTAINERS
+from style_resolver import StyleResolver
+from context_store import context_store_dir, store_context, has_context
+from pdf_extractor import iter_pdf_page_texts
+
+# Bumped when extraction changes, so fingerprints stored by older versions are ignored
+EXTRACTION_VERSION = '3'
+
+# A numbered question paragraph: "3. What is a hub?"
+QUESTION_PARAGRAPH_PATTERN = re.compile(r'^\s*(\d+)\.\s*(.*?)$')
 
 def extract_lab_manual_text_docx(doc_path):
-    """Extract full text from DOCX for context"""
-    doc = Document(doc_path)
-    full_text = []
-    
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for para in cell.paragraphs:
-                    full_text.append(para.text)
-    
-    return "\n".join(full_text)
+    """Extract full text from DOCX for context (accepts a path or a ParsedDocument)"""
+    return load_document(doc_path).text
 
-def extract_lab_manual_text_pdf(pdf_path):
+def extract_lab_manual_text_pdf(pdf_path, pdf_workers=None, page_cache=None):
     """Extract text from PDF for context"""
+    return extract_pdf_text_and_quiz_sections(pdf_path, pdf_workers, page_cache)[0]
+
+def extract_pdf_text_and_quiz_sections(pdf_path, pdf_workers=None, page_cache=None):
+    """Extract text and quiz sections from a PDF, detecting sections as pages arrive.
+    
+    Pages are extracted in parallel (see iter_pdf_page_texts) and fed to a
+    QuizSectionScanner in page order, so quiz detection runs while later
+    pages are still being read.
+    """
     full_text = []
+    scanner = QuizSectionScanner()
+    sections = []
     
     try:
-        # Open the PDF file
-        doc = fitz.open(pdf_path)
-        
-        # Extract text from each page
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            full_text.append(page.get_text())
-        
-        return "\n".join(full_text)
+        for page_text in iter_pdf_page_texts(pdf_path, pdf_workers, page_cache):
+            # Pages are joined with newlines, as in the full text
+            sections.extend(scanner.feed("\n" + page_text if full_text else page_text))
+            full_text.append(page_text)
     
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
-        return ""
+        return "", []
+    
+    return "\n".join(full_text), sections
+
+# Characters clean_text keeps besides word characters and whitespace
+CLEAN_KEEP_CHARS = frozenset('.,:;-()[]{}?!')
+
+class _CleanTable(dict):
+    """str.translate table for clean_text, filled in lazily per character.
+    
+    Bullets become "- ", word characters, whitespace and CLEAN_KEEP_CHARS are
+    kept and everything else is dropped.
+    """
+    
+    def __missing__(self, code):
+        char = chr(code)
+        if char == '•':
+            value = '- '
+        elif char.isalnum() or char == '_' or char.isspace() or char in CLEAN_KEEP_CHARS:
+            value = char
+        else:
+            value = None
+        self[code] = value
+        return value
+
+CLEAN_TABLE = _CleanTable()
+
+# Quiz section markers: a "Quiz(...)" or "Quiz: (Sufficient space ...)" header,
+# and the reference heading that ends the section
+QUIZ_HEADER_PATTERN = re.compile(r'Quiz\(|Quiz: \(Sufficient space to be provided for the answers\)')
+QUIZ_END_PATTERN = re.compile(r'References used by the students:?|Suggested Reference:?')
+# A question number and the whitespace after it, and the "N. " that starts the next question
+QUESTION_NUMBER_PATTERN = re.compile(r'\d+\.\s*')
+QUESTION_BOUNDARY_PATTERN = re.compile(r'\d+\.\s')
 
 def clean_text(text):
     """Clean up text formatting"""
-    # Replace multiple whitespace with single space
-    text = re.sub(r'\s+', ' ', text)
-    # Replace bullet points with dashes
-    text = re.sub(r'•', '- ', text)
-    # Clean up any remaining special characters
-    text = re.sub(r'[^\w\s\.\,\:\;\-\(\)\[\]\{\}\?\!]', '', text)
-    return text.strip()
+    # Collapse whitespace to single spaces, then replace bullets with dashes and
+    # drop other special characters in one translate pass
+    return ' '.join(text.split()).translate(CLEAN_TABLE).strip()
+
+def scan_numbered_items(text):
+    r"""Text following each "N." number, up to the next "N. " or the end.
+    
+    A single left-to-right pass giving the same result as
+    re.findall(r'\d+\.\s*(.*?)(?=\d+\.\s|$)', text, re.DOTALL).
+    """
+    items = []
+    # `$` also matches before a trailing newline
+    text_end = len(text) - 1 if text.endswith('\n') else len(text)
+    number = QUESTION_NUMBER_PATTERN.search(text)
+    while number:
+        start = number.end()
+        boundary = QUESTION_BOUNDARY_PATTERN.search(text, start)
+        end = boundary.start() if boundary else len(text)
+        if start <= text_end < end:
+            end = text_end
+        items.append(text[start:end])
+        number = QUESTION_NUMBER_PATTERN.search(text, end)
+    return items
+
+def scan_quiz_sections(text):
+    """Content between each quiz header and the reference heading that closes it.
+    
+    A single left-to-right pass giving the same sections as the lazy
+    DOTALL pattern used previously: the header runs to the first ")" and
+    the section to the first reference heading after it.
+    """
+    sections = []
+    position = 0
+    while True:
+        header = QUIZ_HEADER_PATTERN.search(text, position)
+        if header is None:
+            break
+        if header.group() == 'Quiz(':
+            close = text.find(')', header.end())
+            if close == -1:
+                # No later header can be closed either
+                break
+            start = close + 1
+        else:
+            start = header.end()
+        # Later headers start their sections no earlier, so a missing end is final
+        end = QUIZ_END_PATTERN.search(text, start)
+        if end is None:
+            break
+        sections.append(text[start:end.start()])
+        position = end.end()
+    return sections
+
+class QuizSectionScanner:
+    """Incremental scan_quiz_sections for text that arrives in pieces.
+    
+    `feed` returns the sections completed by the new text; over all feeds
+    the sections equal scan_quiz_sections on the concatenated text. Only
+    text from the current unfinished section onwards is kept, and searches
+    resume where the previous feed stopped.
+    """
+    
+    # Longest header and end marker, so a marker split across feeds is still found
+    HEADER_LENGTH = len('Quiz: (Sufficient space to be provided for the answers)')
+    END_LENGTH = len('References used by the students')
+    
+    def __init__(self):
+        self.pending = ''
+        self.reset()
+    
+    def reset(self):
+        self.header = None
+        self.header_from = 0
+        self.close_from = 0
+        self.start = None
+        self.end_from = 0
+    
+    def feed(self, text):
+        self.pending += text
+        sections = []
+        while True:
+            if self.start is None:
+                if self.header is None:
+                    self.header = QUIZ_HEADER_PATTERN.search(self.pending, self.header_from)
+                    if self.header is None:
+                        # Keep just enough text to complete a header split across feeds
+                        self.pending = self.pending[max(0, len(self.pending) - self.HEADER_LENGTH + 1):]
+                        break
+                    self.close_from = self.header.end()
+                if self.header.group() == 'Quiz(':
+                    close = self.pending.find(')', self.close_from)
+                    if close == -1:
+                        self.close_from = len(self.pending)
+                        break
+                    self.start = close + 1
+                else:
+                    self.start = self.header.end()
+                self.end_from = self.start
+            
+            end = QUIZ_END_PATTERN.search(self.pending, self.end_from)
+            if end is None:
+                self.end_from = max(self.start, len(self.pending) - self.END_LENGTH + 1)
+                break
+            sections.append(self.pending[self.start:end.start()])
+            self.pending = self.pending[end.end():]
+            self.reset()
+        return sections
 
 def extract_questions_from_quiz_section(quiz_section):
     """Extract numbered questions from a quiz section"""
     # Clean up the text first
     text = clean_text(quiz_section)
     
-    # Regex to capture numbered questions followed by any text
-    question_regex = r'\d+\.\s*(.*?)(?=\d+\.\s|$)'
-    questions = re.findall(question_regex, text, re.DOTALL)
-    
-    # Clean up each question
-    return [clean_text(q) for q in questions if len(clean_text(q)) > 10]
+    # Split into the text following each question number, then clean each question
+    questions = [clean_text(q) for q in scan_numbered_items(text)]
+    return [q for q in questions if len(q) > 10]
 
-def extract_quiz_sections(full_text):
-    """Extract quiz sections from the document text"""
-    # Pattern to identify quiz sections
-    quiz_sections_pattern = r'(Quiz\(.*?\)|Quiz: \(Sufficient space to be provided for the answers\))(.*?)(References used by the students:?|Suggested Reference:?)'
-    quiz_sections = re.findall(quiz_sections_pattern, full_text, re.DOTALL)
+def extract_quiz_sections(full_text, quiz_sections=None):
+    """Extract quiz sections from the document text.
+    
+    `quiz_sections` takes sections already found while the text was read.
+    """
+    if quiz_sections is None:
+        quiz_sections = scan_quiz_sections(full_text)
     
     extracted_sections = []
     if quiz_sections:
         print(f"Found {len(quiz_sections)} quiz sections")
         for section in quiz_sections:
-            quiz_content = section[1].strip()  # Content between 'Quiz' and the reference section
+            quiz_content = section.strip()  # Content between 'Quiz' and the reference section
             extracted_sections.append(quiz_content)
     else:
         print("No quiz sections found using regular pattern")
     
     return extracted_sections
 
+def match_question_paragraph(text):
+    """(number, question) if a paragraph's text is a numbered question, else None"""
+    # Match questions that start with a number followed by period, then text
+    match = QUESTION_PARAGRAPH_PATTERN.match(text.strip())
+    if match:
+        question = match.group(2).strip()
+        if question:  # Only count it if there's actual question text
+            return match.group(1), question
+    return None
+
 def find_question_paragraphs_docx(doc_path):
-    """Find all paragraphs containing numbered questions and extract formatting info (DOCX only)"""
-    doc = Document(doc_path)
-    question_paragraphs = []
+    """Find all paragraphs containing numbered questions and extract formatting info (DOCX only).
+    
+    Paragraphs in table cells are searched too. Each question's location is
+    returned as an anchor (see document_model.make_anchor).
+    """
+    document = load_document(doc_path)
+    question_anchors = []
     question_texts = []
     question_formats = []
     
-    for i, para in enumerate(doc.paragraphs):
-        text = para.text.strip()
-        # Match questions that start with a number followed by period, then text
-        match = re.match(r'^\s*(\d+)\.\s*(.*?)$', text)
-        if match:
-            number = match.group(1)
-            question = match.group(2).strip()
-            if question:  # Only add if there's actual question text
-                question_paragraphs.append(i)
-                question_texts.append(question)
-                
-                # Store font information
-                format_info = {
-                    'font_name': None,
-                    'font_size': None,
-                    'font_color': None,
-                    'alignment': None
-                }
-                
-                # Extract format from first run that contains text
-                for run in para.runs:
-                    if run.text.strip():
-                        if run.font.name:
-                            format_info['font_name'] = run.font.name
-                        if run.font.size:
-                            # Convert to points for serialization
-                            if hasattr(run.font.size, 'pt'):
-                                format_info['font_size'] = run.font.size.pt
-                        if run.font.color and hasattr(run.font.color, 'rgb') and run.font.color.rgb:
-                            # Convert RGB color to hex string for serialization
-                            rgb = run.font.color.rgb
-                            if rgb:
-                                format_info['font_color'] = f"{rgb[0]}:{rgb[1]}:{rgb[2]}"
-                        break
-                
-                # Store paragraph alignment as string for serialization
-                if para.alignment:
-                    format_info['alignment'] = str(para.alignment)
-                
-                question_formats.append(format_info)
-                print(f"Found question {number}: {question}")
-    
-    return question_paragraphs, question_texts, question_formats
-
-def extract_all_questions(file_path):
-    """Extract all questions from either PDF or DOCX document"""
+    for anchor, para, text in document.anchored_paragraphs:
+        found = match_question_paragraph(text)
+        if found:
+            number, question = found
+            question_anchors.append(anchor)
+            question_texts.append(question)
+            
+            # Store the effective font information, resolved through the styles
+            question_formats.append(_paragraph_format(para._p, document.styles))
+            print(f"Found question {number}: {question}")
+    
+    return question_anchors, question_texts, question_formats
+
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+def _w(tag):
+    return f"{{{W_NAMESPACE}}}{tag}"
+
+W_BODY, W_P, W_R, W_TBL, W_TR, W_TC = _w('body'), _w('p'), _w('r'), _w('tbl'), _w('tr'), _w('tc')
+W_HYPERLINK, W_VAL = _w('hyperlink'), _w('val')
+# Run children that carry text, with the text python-docx gives them
+RUN_TEXT_TAGS = {_w('t'): None, _w('tab'): '\t', _w('ptab'): '\t', _w('cr'): '\n', _w('noBreakHyphen'): '-'}
+
+def _run_text(r):
+    """Text of a w:r element, matching python-docx's Run.text"""
+    parts = []
+    for child in r:
+        if child.tag in RUN_TEXT_TAGS:
+            text = RUN_TEXT_TAGS[child.tag]
+            parts.append((child.text or '') if text is None else text)
+        elif child.tag == _w('br'):
+            # Only line breaks count as text; page and column breaks don't
+            parts.append('\n' if child.get(_w('type'), 'textWrapping') == 'textWrapping' else '')
+    return ''.join(parts)
+
+def _paragraph_text(p):
+    """Text of a w:p element, matching python-docx's Paragraph.text"""
+    parts = []
+    for child in p:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(r) for r in child.iterchildren(W_R))
+    return ''.join(parts)
+
+def _property(parent, path):
+    """w:val of the element at `path` below `parent`, or None"""
+    element = parent.find(path, {'w': W_NAMESPACE})
+    return element.get(W_VAL) if element is not None else None
+
+def _paragraph_format(p, styles):
+    """Effective formatting of a question paragraph, taken from its first run with text.
+    
+    `styles` is the document's StyleResolver, so fonts inherited from
+    docDefaults and paragraph or character styles are captured as well as
+    direct formatting.
+    """
+    first_run = next((r for r in p.iterchildren(W_R) if _run_text(r).strip()), None)
+    return styles.run_format(p, first_run)
+
+def _table_texts(tbl):
+    """Cell paragraph texts of a w:tbl element in the order python-docx's row.cells yields them.
+    
+    Horizontally spanned cells repeat once per grid column and vertically
+    merged continuation cells repeat the cell they continue.
+    """
+    texts = []
+    above = {}
+    for tr in tbl.iterchildren(W_TR):
+        row = {}
+        offset = int(_property(tr, 'w:trPr/w:gridBefore') or 0)
+        for tc in tr.iterchildren(W_TC):
+            span = int(_property(tc, 'w:tcPr/w:gridSpan') or 1)
+            merge = tc.find('w:tcPr/w:vMerge', {'w': W_NAMESPACE})
+            if merge is not None and merge.get(W_VAL, 'continue') == 'continue':
+                cell_texts = above.get(offset, [])
+            else:
+                cell_texts = [_paragraph_text(p) for p in tc.iterchildren(W_P)]
+            row[offset] = cell_texts
+            texts.extend(cell_texts * span)
+            offset += span
+        above = row
+    return texts
+
+def stream_docx_text_and_questions(doc_path):
+    """Extract full text and question paragraphs from a DOCX in one streaming pass.
+    
+    Reads only word/document.xml from the zip package (media parts are never
+    loaded) with iterparse, and clears each top-level body element once it
+    has been processed, so peak memory stays flat however large the manual
+    is. Returns the same (full_text, question_anchors, question_texts,
+    question_formats) as the python-docx based extractors.
+    """
+    paragraph_texts = []
+    table_texts = []
+    question_anchors = []
+    question_texts = []
+    question_formats = []
+    
+    with zipfile.ZipFile(doc_path) as package, package.open('word/document.xml') as xml:
+        styles = StyleResolver.from_package(package)
+        depth = 0
+        body = None
+        # Index of the current top-level element; processed ones are deleted from the tree
+        body_index = 0
+        for event, element in etree.iterparse(xml, events=('start', 'end'), huge_tree=True):
+            if event == 'start':
+                depth += 1
+                if depth == 2 and element.tag == W_BODY:
+                    body = element
+                continue
+            depth -= 1
+            # Only top-level body elements (depth 2 once closed) are processed
+            if depth != 2 or body is None or element.getparent() is not body or not isinstance(element.tag, str):
+                continue
+            
+            if element.tag == W_P:
+                paragraph_texts.append(_paragraph_text(element))
+            elif element.tag == W_TBL:
+                table_texts.extend(_table_texts(element))
+            
+            # Questions are looked for in this element's paragraphs, table cells included
+            if element.tag == W_P:
+                paragraphs = [((body_index,), element)]
+            elif element.tag in ANCHOR_CONTAINERS:
+                paragraphs = iter_body_paragraphs(element, (body_index,))
+            else:
+                paragraphs = ()
+            for path, p in paragraphs:
+                text = paragraph_texts[-1] if p is element else _paragraph_text(p)
+                found = match_question_paragraph(text)
+                if found:
+                    number, question = found
+                    question_anchors.append(make_anchor(path, text))
+                    question_texts.append(question)
+                    question_formats.append(_paragraph_format(p, styles))
+                    print(f"Found question {number}: {question}")
+            body_index += 1
+            
+            # Drop the processed element and everything before it
+            element.clear()
+            while element.getprevious() is not None:
+                del body[0]
+    
+    full_text = "\n".join(paragraph_texts + table_texts)
+    return full_text, question_anchors, question_texts, question_formats
+
+def fingerprint(text):
+    """Short content hash of a piece of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def file_fingerprint(path):
+    """Content hash of a whole input file, tied to the extraction version"""
+    digest = hashlib.sha256(EXTRACTION_VERSION.encode('utf-8'))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def questions_from_sections(quiz_sections, known_sections=None):
+    """Extract the questions of each quiz section.
+    
+    `known_sections` maps section fingerprints from a previous extraction to
+    their questions; unchanged sections reuse them instead of being scanned
+    again. Returns the questions and a fingerprint and question count per
+    section.
+    """
+    all_questions = []
+    sections = []
+    reused = 0
+    for i, section in enumerate(quiz_sections):
+        key = fingerprint(section)
+        if known_sections and key in known_sections:
+            questions = known_sections[key]
+            reused += 1
+        else:
+            questions = extract_questions_from_quiz_section(section)
+        print(f"Quiz section {i+1}: Found {len(questions)} questions")
+        all_questions.extend(questions)
+        sections.append({"hash": key, "count": len(questions)})
+    if reused:
+        print(f"Reused {reused} of {len(quiz_sections)} quiz sections unchanged since the last extraction")
+    return all_questions, sections
+
+def known_sections_from(question_data):
+    """Section fingerprint -> questions, from a previously saved extraction"""
+    stored = question_data.get("fingerprint") or {}
+    sections = stored.get("sections") or []
+    questions = question_data.get("questions", [])
+    # Only extractions made from quiz sections by this version can be reused
+    if stored.get("version") != EXTRACTION_VERSION or sum(s["count"] for s in sections) != len(questions):
+        return {}
+    known = {}
+    start = 0
+    for section in sections:
+        known[section["hash"]] = questions[start:start + section["count"]]
+        start += section["count"]
+    return known
+
+def question_changes(old_questions, new_questions):
+    """Questions that are new, changed or removed between two extractions.
+    
+    The question lists are aligned with a sequence diff; a replaced run of
+    questions counts as changed pairwise and any surplus as new or removed.
+    """
+    changes = {"new": [], "changed": [], "removed": []}
+    matcher = difflib.SequenceMatcher(None, old_questions, new_questions, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == 'equal':
+            continue
+        paired = min(i2 - i1, j2 - j1) if op == 'replace' else 0
+        changes["changed"].extend(
+            {"old": old, "new": new}
+            for old, new in zip(old_questions[i1:i1 + paired], new_questions[j1:j1 + paired])
+        )
+        changes["removed"].extend(old_questions[i1 + paired:i2])
+        changes["new"].extend(new_questions[j1 + paired:j2])
+    return changes
+
+def extract_all_questions(file_path, document=None, streaming=False, pdf_workers=None, page_cache=None):
+    """Extract all questions from either PDF or DOCX document.
+    
+    For DOCX input an already parsed `document` can be passed in so the
+    file is not parsed again, or `streaming` selects the low-memory
+    extractor that reads word/document.xml directly. PDF pages are
+    extracted by `pdf_workers` processes and cached in `page_cache` (a
+    PageTextCache or the path of one).
+    """
+    return extract_questions_and_sections(file_path, document, streaming, pdf_workers, page_cache)[:5]
+
+def extract_questions_and_sections(file_path, document=None, streaming=False, pdf_workers=None, page_cache=None,
+                                   known_sections=None):
+    """extract_all_questions plus the quiz section fingerprints (see questions_from_sections)"""
     file_ext = os.path.splitext(file_path)[1].lower()
     all_questions = []
     full_text = ""
-    question_indices = []
+    question_anchors = []
     question_texts = []
     question_formats = []
+    sections = []
     
     # Extract text based on file type
     if file_ext == '.pdf':
         print(f"Processing PDF document: {file_path}")
-        full_text = extract_lab_manual_text_pdf(file_path)
-        quiz_sections = extract_quiz_sections(full_text)
+        full_text, quiz_sections = extract_pdf_text_and_quiz_sections(file_path, pdf_workers, page_cache)
+        quiz_sections = extract_quiz_sections(full_text, quiz_sections)
         
         # Extract questions from quiz sections
         if quiz_sections:
-            for i, section in enumerate(quiz_sections):
-                questions = extract_questions_from_quiz_section(section)
-                print(f"Quiz section {i+1}: Found {len(questions)} questions")
-                all_questions.extend(questions)
+            all_questions, sections = questions_from_sections(quiz_sections, known_sections)
         else:
             # If no quiz sections found, try to extract all numbered questions
             all_questions = extract_questions_from_quiz_section(full_text)
@@ -157,17 +494,18 @@ def extract_all_questions(file_path):
             
     elif file_ext == '.docx':
         print(f"Processing DOCX document: {file_path}")
-        full_text = extract_lab_manual_text_docx(file_path)
-        question_indices, question_texts, question_formats = find_question_paragraphs_docx(file_path)
+        if streaming and document is None:
+            full_text, question_anchors, question_texts, question_formats = stream_docx_text_and_questions(file_path)
+        else:
+            document = load_document(document or file_path)
+            full_text = extract_lab_manual_text_docx(document)
+            question_anchors, question_texts, question_formats = find_question_paragraphs_docx(document)
         
         quiz_sections = extract_quiz_sections(full_text)
         
         # Extract questions from quiz sections
         if quiz_sections:
-            for i, section in enumerate(quiz_sections):
-                questions = extract_questions_from_quiz_section(section)
-                print(f"Quiz section {i+1}: Found {len(questions)} questions")
-                all_questions.extend(questions)
+            all_questions, sections = questions_from_sections(quiz_sections, known_sections)
         else:
             # If no quiz sections, use the questions found in paragraphs
             all_questions = question_texts if question_texts else extract_questions_from_quiz_section(full_text)
@@ -175,7 +513,7 @@ def extract_all_questions(file_path):
     else:
         print(f"Unsupported file format: {file_ext}")
     
-    return all_questions, full_text, question_indices, question_texts, question_formats
+    return all_questions, full_text, question_anchors, question_texts, question_formats, sections
 
 def create_student_answer(question, context):
     """Create a simple student-like answer based on the question type"""
@@ -221,24 +559,66 @@ def create_student_answer(question, context):
     else:
         return "This relates to computer networking concepts covered in the lab manual."
 
+def load_question_data(questions_json):
+    """Previously saved question data, or {} if there is none"""
+    try:
+        with open(questions_json, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 # Function that matches the import in main.py
-def extract_and_save_questions(input_file, output_json):
-    """Extract questions from document and save to JSON file"""
+def extract_and_save_questions(input_file, output_json, document=None, streaming=False, pdf_workers=None,
+                               page_cache=None):
+    """Extract questions from document and save to JSON file.
+    
+    The manual text is kept in a content-addressed sidecar file (see
+    context_store) referenced by "context_ref". The saved data carries a
+    fingerprint of the input file and of each quiz section. An unchanged
+    input is not extracted again, and the JSON file only loses the changes
+    already reported for the previous extraction; otherwise only changed
+    quiz sections are re-scanned and the data lists the questions that are
+    new, changed or removed.
+    """
     print(f"Processing lab manual: {input_file}")
     
+    previous = load_question_data(output_json)
+    file_hash = file_fingerprint(input_file)
+    if (previous.get("questions") and (previous.get("fingerprint") or {}).get("file") == file_hash
+            and has_context(previous, output_json)):
+        print(f"Lab manual unchanged since the last extraction; keeping {output_json}")
+        if previous.pop("changes", None) is not None:
+            # Nothing changed since then, so the previous changes shouldn't be reported again
+            with open(output_json, 'w', encoding='utf-8') as f:
+                json.dump(previous, f, ensure_ascii=False, indent=2)
+        return True
+    
     # Extract questions and text from the document
-    all_questions, full_text, question_indices, question_texts, question_formats = extract_all_questions(input_file)
+    all_questions, full_text, question_anchors, question_texts, question_formats, sections = (
+        extract_questions_and_sections(
+            input_file, document, streaming, pdf_workers, page_cache, known_sections_from(previous)
+        )
+    )
     
     if all_questions:
         print(f"Found a total of {len(all_questions)} questions")
+        changes = question_changes(previous.get("questions", []), all_questions)
+        if previous.get("questions") and any(changes.values()):
+            print(f"Since the last extraction: {len(changes['new'])} new, {len(changes['changed'])} changed, "
+                  f"{len(changes['removed'])} removed questions")
+        
+        # The manual text goes to the context store; the JSON only references it
+        context_ref = store_context(full_text, context_store_dir(output_json))
         
         # Create the data structure to save
         question_data = {
             "questions": all_questions,
-            "context": full_text,
-            "question_indices": question_indices,
+            "context_ref": context_ref,
+            "question_anchors": question_anchors,
             "question_texts": question_texts,
-            "question_formats": question_formats
+            "question_formats": question_formats,
+            "fingerprint": {"version": EXTRACTION_VERSION, "file": file_hash, "sections": sections},
+            "changes": changes
         }
         
         # Save to JSON file
@@ -256,7 +636,7 @@ def extract_and_save_questions_and_answers(input_file, output_json):
     print(f"Processing lab manual: {input_file}")
     
     # Extract questions from the document
-    all_questions, full_text, question_indices, question_texts, question_formats = extract_all_questions(input_file)
+    all_questions, full_text, question_anchors, question_texts, question_formats = extract_all_questions(input_file)
     
     # Generate simple, well-formatted student-style answers
     all_answers = []
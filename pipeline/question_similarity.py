@@ -0,0 +1,241 @@
+import re
+import math
+import time
+import sqlite3
+import hashlib
+import numpy as np
+from collections import defaultdict
+
+DEFAULT_INDEX_PATH = "question_index.sqlite3"
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+# Minimum similarity for writing an answer under a question that isn't an exact match
+DEFAULT_MATCH_THRESHOLD = 0.6
+
+# MinHash signature of NUM_PERMUTATIONS values split into LSH_BANDS bands;
+# with 16 bands of 4 rows, pairs above ~0.5 Jaccard become candidates
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 4
+# Words are truncated to this many characters as a cheap stemmer
+# ("differentiate" and "difference" both become "diffe")
+STEM_CHARS = 5
+
+MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240901)
+_PERM_A = _rng.randint(1, MERSENNE_PRIME, size=NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, MERSENNE_PRIME, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+NUMBERING_PATTERN = re.compile(r'^\s*(?:q\s*)?\d+\s*[\.\)]\s*')
+STOPWORDS = frozenset("""
+a an and are as at be between by can do does for from how in is it its of on or
+that the their them there these this to was what when where which who why will
+with write give state list briefly short note notes
+""".split())
+
+def normalize_question(text):
+    """Lowercase, drop numbering and stopwords, and stem words by truncation"""
+    text = NUMBERING_PATTERN.sub('', text.lower())
+    words = [w[:STEM_CHARS] for w in WORD_PATTERN.findall(text) if w not in STOPWORDS]
+    return ' '.join(words)
+
+def text_key(text):
+    """Case, punctuation and numbering insensitive form of a question, for exact matches"""
+    return ' '.join(WORD_PATTERN.findall(NUMBERING_PATTERN.sub('', text.lower())))
+
+def shingles(normalized):
+    """Character shingles of a normalized question"""
+    padded = f" {normalized} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def minhash_signature(shingle_set):
+    """MinHash signature of a shingle set"""
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') % MERSENNE_PRIME
+         for s in shingle_set),
+        dtype=np.uint64, count=len(shingle_set)
+    )
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+def band_keys(signature):
+    """One bucket key per LSH band"""
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [hashlib.blake2b(signature[b * rows:(b + 1) * rows].tobytes(), digest_size=8).hexdigest()
+            for b in range(LSH_BANDS)]
+
+class QuestionIndex:
+    """Persistent MinHash/LSH index of answered questions.
+
+    Lets near-duplicate questions ("Differentiate hub and switch" vs
+    "Difference between hub and switch") reuse a stored answer. Candidates
+    come from LSH buckets and are confirmed with exact shingle Jaccard
+    similarity against `threshold`. Answers are only reused for the model
+    and prompt version that produced them.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.lookups = 0
+        self.hits = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(questions)")}
+        if columns and 'prompt_version' not in columns:
+            # Indexes from before answers were keyed on the prompt version can't say which prompt they came from
+            self.conn.execute("DROP TABLE questions")
+            self.conn.execute("DROP TABLE IF EXISTS lsh_buckets")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                question TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                model TEXT,
+                prompt_version TEXT,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                UNIQUE (normalized, model, prompt_version)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                question_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, question_id)
+            )
+        """)
+        self.conn.commit()
+
+    def lookup(self, question, model_name=None, prompt_version=None):
+        """Return (stored question, answer, similarity) for the best near-duplicate, or None"""
+        self.lookups += 1
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        query_shingles = shingles(normalized)
+        buckets = band_keys(minhash_signature(query_shingles))
+
+        placeholders = ' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))
+        params = [v for band, bucket in enumerate(buckets) for v in (band, bucket)]
+        rows = self.conn.execute(
+            f"SELECT DISTINCT q.question, q.normalized, q.answer FROM lsh_buckets b "
+            f"JOIN questions q ON q.id = b.question_id "
+            f"WHERE ({placeholders}) AND q.model IS ? AND q.prompt_version IS ?",
+            params + [model_name, prompt_version]
+        ).fetchall()
+
+        best = None
+        for stored_question, stored_normalized, answer in rows:
+            similarity = jaccard(query_shingles, shingles(stored_normalized))
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (stored_question, answer, similarity)
+        if best is not None:
+            self.hits += 1
+        return best
+
+    def add(self, question, answer, model_name=None, prompt_version=None):
+        """Index an answered question"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        self.conn.execute(
+            "INSERT INTO questions (question, normalized, model, prompt_version, answer, created) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (normalized, model, prompt_version) DO UPDATE SET "
+            "question = excluded.question, answer = excluded.answer, created = excluded.created",
+            (question, normalized, model_name, prompt_version, answer, time.time())
+        )
+        question_id = self.conn.execute(
+            "SELECT id FROM questions WHERE normalized = ? AND model IS ? AND prompt_version IS ?",
+            (normalized, model_name, prompt_version)
+        ).fetchone()[0]
+        buckets = band_keys(minhash_signature(shingles(normalized)))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO lsh_buckets (band, bucket, question_id) VALUES (?, ?, ?)",
+            [(band, bucket, question_id) for band, bucket in enumerate(buckets)]
+        )
+        self.conn.commit()
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def close(self):
+        self.conn.close()
+
+class AnswerMatcher:
+    """In-memory index matching question paragraphs to answered questions.
+
+    Built once per document write. Exact hits are a dict lookup on
+    text_key. Otherwise candidates come from an inverted index of
+    normalized-question shingles and are scored by Jaccard similarity. A
+    candidate at or above `threshold` must share at least
+    ceil(threshold * |query|) of the query's shingles. So only the rarest
+    |query| - ceil(threshold * |query|) + 1 query shingles are probed, and
+    common shingles never pull in the whole index.
+    """
+
+    def __init__(self, qa_pairs, threshold=DEFAULT_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.exact = {}
+        self.entries = []
+        self.postings = defaultdict(list)
+        for question, answer in qa_pairs:
+            self.add(question, answer)
+
+    def add(self, question, answer):
+        entry_id = len(self.entries)
+        # Later pairs win, as in a dict built from the answers
+        self.exact[text_key(question)] = entry_id
+        normalized = normalize_question(question)
+        question_shingles = shingles(normalized) if normalized else set()
+        for shingle in question_shingles:
+            self.postings[shingle].append(entry_id)
+        self.entries.append((question, answer, question_shingles))
+
+    def match(self, question):
+        """Return (answered question, answer, similarity) for the best match, or None"""
+        entry_id = self.exact.get(text_key(question))
+        if entry_id is not None:
+            matched, answer, _ = self.entries[entry_id]
+            return matched, answer, 1.0
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        query = shingles(normalized)
+        needed = max(1, math.ceil(self.threshold * len(query)))
+        probes = sorted(query, key=lambda s: len(self.postings.get(s, ())))[:len(query) - needed + 1]
+        candidates = {entry_id for s in probes for entry_id in self.postings.get(s, ())}
+
+        best = None
+        for entry_id in candidates:
+            matched, answer, entry_shingles = self.entries[entry_id]
+            similarity = jaccard(query, entry_shingles)
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (matched, answer, similarity)
+        return best
+
+def group_near_duplicates(questions, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+    """Index of the first question each question is a near-duplicate of.
+
+    A question that matches no earlier one is its own group and maps to
+    its own index.
+    """
+    leaders = AnswerMatcher([], threshold)
+    groups = []
+    for i, question in enumerate(questions):
+        match = leaders.match(question)
+        if match is None:
+            leaders.add(question, i)
+            groups.append(i)
+        else:
+            groups.append(match[1])
+    return groups
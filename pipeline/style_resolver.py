@@ -0,0 +1,159 @@
+import posixpath
+from lxml import etree
+from docx.oxml.ns import nsmap, qn
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
+def theme_fonts(theme_xml):
+    """Major and minor Latin typefaces of a theme part"""
+    if not theme_xml:
+        return {}
+    root = etree.fromstring(theme_xml)
+    fonts = {}
+    for kind in ('major', 'minor'):
+        latin = root.find(f'.//a:{kind}Font/a:latin', {'a': nsmap['a']})
+        if latin is not None and latin.get('typeface'):
+            fonts[kind] = latin.get('typeface')
+    return fonts
+
+def _val(element, path):
+    """w:val of the element at `path` below `element`, or None"""
+    if element is None:
+        return None
+    found = element.find(path, {'w': nsmap['w']})
+    return found.get(qn('w:val')) if found is not None else None
+
+class StyleResolver:
+    """Effective run formatting of a DOCX, resolved through its style hierarchy.
+
+    Formatting is layered docDefaults -> paragraph style -> character style
+    -> direct run properties, with basedOn chains followed for styles and
+    theme fonts looked up in the theme part. Each style's resolved
+    properties, and each paragraph/character style pair, are computed once
+    and memoized, so resolving a run costs a couple of dict merges.
+    """
+
+    def __init__(self, styles_element, fonts=None):
+        self.theme_fonts = fonts or {}
+        self.styles = {}
+        self.default_styles = {}
+        self.defaults = {}
+        self._resolved = {}
+        self._combined = {}
+        if styles_element is None:
+            return
+        for style in styles_element.iterchildren(qn('w:style')):
+            style_id = style.get(qn('w:styleId'))
+            self.styles[style_id] = style
+            if style.get(qn('w:default')) in ('1', 'true', 'on'):
+                self.default_styles.setdefault(style.get(qn('w:type')), style_id)
+        defaults = styles_element.find(qn('w:docDefaults'))
+        if defaults is not None:
+            self.defaults.update(self.run_properties(defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}")))
+            self.defaults.update(self.paragraph_properties(defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}")))
+
+    @classmethod
+    def from_document(cls, doc):
+        """Resolver for a python-docx Document"""
+        try:
+            theme = doc.part.part_related_by(RT.THEME).blob
+        except KeyError:
+            theme = None
+        return cls(doc.styles.element, theme_fonts(theme))
+
+    @classmethod
+    def from_package(cls, package):
+        """Resolver for an open DOCX zip, reading only the styles and theme parts"""
+        names = set(package.namelist())
+        styles = etree.fromstring(package.read('word/styles.xml')) if 'word/styles.xml' in names else None
+        theme = None
+        if 'word/_rels/document.xml.rels' in names:
+            rels = etree.fromstring(package.read('word/_rels/document.xml.rels'))
+            for rel in rels:
+                if rel.get('Type') == RT.THEME:
+                    path = posixpath.normpath(posixpath.join('word', rel.get('Target')))
+                    theme = package.read(path) if path in names else None
+                    break
+        return cls(styles, theme_fonts(theme))
+
+    def run_properties(self, rPr):
+        """Font name, size and color set by a w:rPr element"""
+        props = {}
+        if rPr is None:
+            return props
+        fonts = rPr.find(qn('w:rFonts'))
+        if fonts is not None:
+            # A theme font takes precedence over an explicit name
+            theme = fonts.get(qn('w:asciiTheme'))
+            name = self.theme_fonts.get(theme[:5]) if theme else None
+            name = name or fonts.get(qn('w:ascii'))
+            if name:
+                props['font_name'] = name
+        size = _val(rPr, 'w:sz')
+        if size and size.isdigit():
+            props['font_size'] = int(size) / 2.0
+        color = _val(rPr, 'w:color')
+        if color:
+            props['font_color'] = None
+            if color != 'auto' and len(color) == 6:
+                try:
+                    props['font_color'] = ':'.join(str(int(color[i:i + 2], 16)) for i in (0, 2, 4))
+                except ValueError:
+                    pass
+        return props
+
+    def paragraph_properties(self, pPr):
+        """Alignment set by a w:pPr element"""
+        justification = _val(pPr, 'w:jc')
+        if not justification:
+            return {}
+        try:
+            return {'alignment': WD_PARAGRAPH_ALIGNMENT.from_xml(justification)}
+        except ValueError:
+            return {}
+
+    def style_properties(self, style_id):
+        """Properties of a style including those inherited through basedOn (memoized)"""
+        if style_id in self._resolved:
+            return self._resolved[style_id]
+        # Guard against basedOn cycles while this style is being resolved
+        self._resolved[style_id] = {}
+        style = self.styles.get(style_id)
+        props = {}
+        if style is not None:
+            based_on = _val(style, 'w:basedOn')
+            if based_on:
+                props.update(self.style_properties(based_on))
+            props.update(self.run_properties(style.find(qn('w:rPr'))))
+            props.update(self.paragraph_properties(style.find(qn('w:pPr'))))
+        self._resolved[style_id] = props
+        return props
+
+    def style_pair_properties(self, paragraph_style, character_style):
+        """docDefaults, paragraph style and character style merged (memoized)"""
+        key = (paragraph_style, character_style)
+        if key not in self._combined:
+            props = dict(self.defaults)
+            props.update(self.style_properties(paragraph_style))
+            # Character styles only carry run properties
+            props.update((k, v) for k, v in self.style_properties(character_style).items() if k != 'alignment')
+            self._combined[key] = props
+        return self._combined[key]
+
+    def run_format(self, p, r=None):
+        """Effective format_info of run `r` in paragraph `p` (or of the paragraph when `r` is None)"""
+        paragraph_style = _val(p, 'w:pPr/w:pStyle') or self.default_styles.get('paragraph')
+        character_style = (_val(r, 'w:rPr/w:rStyle') if r is not None else None) or self.default_styles.get('character')
+        props = dict(self.style_pair_properties(paragraph_style, character_style))
+        if r is not None:
+            props.update(self.run_properties(r.find(qn('w:rPr'))))
+        props.update(self.paragraph_properties(p.find(qn('w:pPr'))))
+
+        alignment = props.get('alignment')
+        return {
+            'font_name': props.get('font_name'),
+            'font_size': props.get('font_size'),
+            'font_color': props.get('font_color'),
+            # Left alignment (0) is the default and is not recorded
+            'alignment': str(alignment) if alignment else None
+        }
@@ -0,0 +1,104 @@
+import re
+import time
+import random
+
+from question_extractor import (
+    QuizSectionScanner, clean_text, scan_numbered_items, scan_quiz_sections, extract_questions_from_quiz_section
+)
+
+# The regexes the scanners replaced, kept as the reference behaviour
+OLD_QUIZ_SECTIONS_PATTERN = (r'(Quiz\(.*?\)|Quiz: \(Sufficient space to be provided for the answers\))(.*?)'
+                             r'(References used by the students:?|Suggested Reference:?)')
+OLD_QUESTION_PATTERN = r'\d+\.\s*(.*?)(?=\d+\.\s|$)'
+
+def old_clean_text(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'•', '- ', text)
+    text = re.sub(r'[^\w\s\.\,\:\;\-\(\)\[\]\{\}\?\!]', '', text)
+    return text.strip()
+
+def old_quiz_sections(text):
+    return [section[1] for section in re.findall(OLD_QUIZ_SECTIONS_PATTERN, text, re.DOTALL)]
+
+def old_numbered_items(text):
+    return re.findall(OLD_QUESTION_PATTERN, text, re.DOTALL)
+
+def old_questions(quiz_section):
+    text = old_clean_text(quiz_section)
+    return [old_clean_text(q) for q in old_numbered_items(text) if len(old_clean_text(q)) > 10]
+
+FRAGMENTS = [
+    'Quiz(', 'Quiz: (Sufficient space to be provided for the answers)', ')', '(',
+    'References used by the students', 'References used by the students:', 'Suggested Reference',
+    'Suggested Reference:', '1.', '2. ', '10.', '.', ' ', '\n', '\t', '  ', '•', 'é', '→', '_',
+    'What is a hub?', 'Explain the OSI model', 'x', '3', ':',
+]
+
+def random_text(rng, parts=40):
+    return ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, parts)))
+
+def random_texts(count, seed):
+    rng = random.Random(seed)
+    return [random_text(rng) for _ in range(count)]
+
+def feed_in_pieces(text, rng):
+    scanner = QuizSectionScanner()
+    sections = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        sections.extend(scanner.feed(text[position:position + size]))
+        position += size
+    return sections
+
+def test_quiz_sections_match_old_regex():
+    for text in random_texts(3000, seed=15):
+        assert scan_quiz_sections(text) == old_quiz_sections(text), f"input: {text!r}"
+
+def test_scanner_feeds_match_whole_text_scan():
+    for text in random_texts(1000, seed=16):
+        expected = old_quiz_sections(text)
+        assert QuizSectionScanner().feed(text) == expected, f"input: {text!r}"
+        assert feed_in_pieces(text, random.Random(text)) == expected, f"input fed in pieces: {text!r}"
+
+def test_numbered_items_match_old_regex():
+    for text in random_texts(3000, seed=17):
+        assert scan_numbered_items(text) == old_numbered_items(text), f"input: {text!r}"
+        assert clean_text(text) == old_clean_text(text), f"input: {text!r}"
+        assert extract_questions_from_quiz_section(text) == old_questions(text), f"input: {text!r}"
+
+def test_manual_quiz_section():
+    text = ("Aim: study networking devices.\nQuiz(Sufficient space to be provided)\n"
+            "1. Differentiate hub and switch.\n2. What is a router used for?\n"
+            "Suggested Reference: Tanenbaum\n")
+    sections = scan_quiz_sections(text)
+    assert sections == old_quiz_sections(text)
+    assert extract_questions_from_quiz_section(sections[0]) == [
+        'Differentiate hub and switch.', 'What is a router used for?'
+    ]
+
+# Headers that never close, and closed headers with no reference heading after them
+UNTERMINATED_HEADERS = {
+    'unclosed': 'Quiz(x ' * 20000,
+    'closed': 'Quiz() 1. question text ' * 20000,
+    'sufficient_space': 'Quiz: (Sufficient space to be provided for the answers) ' * 5000,
+}
+
+def test_unterminated_quiz_headers_scan_in_linear_time():
+    for name, text in UNTERMINATED_HEADERS.items():
+        start = time.perf_counter()
+        assert scan_quiz_sections(text) == [], name
+        sections = []
+        scanner = QuizSectionScanner()
+        for i in range(0, len(text), 4096):
+            sections.extend(scanner.feed(text[i:i + 4096]))
+        assert sections == [], name
+        # The old pattern backtracks polynomially here: about 100s for just 1000 closed headers
+        assert time.perf_counter() - start < 2.0, name
+
+def test_long_numbered_run_scans_in_linear_time():
+    text = '1.' * 100000 + ' question without a following number'
+    start = time.perf_counter()
+    items = scan_numbered_items(text)
+    assert items == ['1.' * 99998, 'question without a following number']
+    assert time.perf_counter() - start < 2.0
@@ -0,0 +1,121 @@
+import os
+import json
+import shutil
+import asyncio
+
+from answer_backends import LocalBackend
+from answer_cache import AnswerCache
+from answer_generator import update_answers, RequestScheduler
+from question_similarity import QuestionIndex
+
+SAMPLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class CountingBackend(LocalBackend):
+    """Local backend that counts the prompts it is sent"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, prompt, questions, json_mode=False, session=None):
+        self.calls += 1
+        return await super().generate(prompt, questions, json_mode, session)
+
+def unthrottled():
+    return RequestScheduler(requests_per_minute=100000)
+
+def copy_sample(tmp_path):
+    """The repo's sample questions and answers files, saved before answers recorded cache keys"""
+    questions_json = str(tmp_path / "questions_data.json")
+    answers_json = str(tmp_path / "answers_data.json")
+    shutil.copy(os.path.join(SAMPLE_DIR, "questions_data.json"), questions_json)
+    shutil.copy(os.path.join(SAMPLE_DIR, "answers_data.json"), answers_json)
+    return questions_json, answers_json
+
+def run_update(questions_json, answers_json, cache):
+    backend = CountingBackend()
+    assert asyncio.run(update_answers(questions_json, answers_json, scheduler=unthrottled(), cache=cache,
+                                      backend=backend))
+    return backend.calls
+
+def test_legacy_answers_are_kept_with_an_empty_cache(tmp_path):
+    questions_json, answers_json = copy_sample(tmp_path)
+    with open(answers_json, encoding='utf-8') as f:
+        legacy_pairs = json.load(f)["qa_pairs"]
+    with open(questions_json, encoding='utf-8') as f:
+        questions = json.load(f)["questions"]
+    assert all("cache_key" not in pair for pair in legacy_pairs)
+    legacy = {pair["question"].strip(): pair["answer"] for pair in legacy_pairs}
+
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    assert run_update(questions_json, answers_json, cache) == 0
+
+    with open(answers_json, encoding='utf-8') as f:
+        qa_pairs = json.load(f)["qa_pairs"]
+    assert [pair["question"] for pair in qa_pairs] == list(dict.fromkeys(questions))
+    for pair in qa_pairs:
+        assert pair["answer"] == legacy[pair["question"].strip()]
+        assert pair["cache_key"]
+
+    # Stamped pairs are reused by key on the next run
+    assert run_update(questions_json, answers_json, cache) == 0
+    cache.close()
+
+def test_answer_whose_prompt_changed_is_generated_again(tmp_path):
+    questions_json, answers_json = copy_sample(tmp_path)
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+    run_update(questions_json, answers_json, cache)
+
+    with open(answers_json, encoding='utf-8') as f:
+        answers_data = json.load(f)
+    answers_data["qa_pairs"][0]["cache_key"] = "stale"
+    with open(answers_json, 'w', encoding='utf-8') as f:
+        json.dump(answers_data, f)
+    assert run_update(questions_json, answers_json, cache) == 1
+    cache.close()
+
+def test_batch_answers_are_not_served_for_single_prompts(tmp_path):
+    questions_json, answers_json = copy_sample(tmp_path)
+    os.remove(answers_json)
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+
+    def run(batch_size):
+        backend = CountingBackend()
+        assert asyncio.run(update_answers(questions_json, answers_json, scheduler=unthrottled(), cache=cache,
+                                          backend=backend, batch_size=batch_size))
+        return backend.calls
+
+    assert run(batch_size=4) == 6
+    # The same batches are answered from the cache
+    assert run(batch_size=4) == 0
+    # Single-question prompts differ from the batch prompts, so each question is asked on its own
+    assert run(batch_size=1) == 22
+    assert run(batch_size=1) == 0
+    cache.close()
+
+def test_near_duplicate_reuse_is_looked_up_again(tmp_path):
+    questions_json = str(tmp_path / "questions_data.json")
+    answers_json = str(tmp_path / "answers_data.json")
+    with open(questions_json, 'w', encoding='utf-8') as f:
+        json.dump({"questions": ["Differentiate hub and switch.", "Differentiate hub and switch device."],
+                   "context": "A hub repeats every frame. A switch forwards frames by MAC address."}, f)
+    cache = AnswerCache(str(tmp_path / "answer_cache.sqlite3"))
+
+    def run(threshold):
+        backend = CountingBackend()
+        question_index = QuestionIndex(str(tmp_path / "question_index.sqlite3"), threshold)
+        assert asyncio.run(update_answers(questions_json, answers_json, scheduler=unthrottled(), cache=cache,
+                                          backend=backend, question_index=question_index))
+        question_index.close()
+        with open(answers_json, encoding='utf-8') as f:
+            return backend.calls, json.load(f)["qa_pairs"]
+
+    calls, qa_pairs = run(threshold=0.6)
+    assert calls == 1
+    assert qa_pairs[1]["reused_from"] == "Differentiate hub and switch."
+    assert "cache_key" not in qa_pairs[1]
+    # The reuse is looked up again rather than served as an exact cache hit
+    calls, qa_pairs = run(threshold=0.6)
+    assert calls == 0 and "reused_from" in qa_pairs[1]
+    calls, qa_pairs = run(threshold=0.8)
+    assert calls == 1 and "reused_from" not in qa_pairs[1]
+    cache.close()